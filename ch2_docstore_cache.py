@@ -0,0 +1,185 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.stores import BaseStore
+
+from ch2_pg_docstore import PooledPostgresDocStore, connection
+
+
+def document_size(doc: Document) -> int:
+    # 粗略估算一个 Document 占用的内存（字节）：正文 + 元数据的键和值
+    size = sys.getsizeof(doc) + sys.getsizeof(doc.page_content)
+    for key, value in doc.metadata.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+# 进程内的父文档缓存，可以套在任意 docstore 外面
+# - LRU：条目数超过 max_entries 或估算内存超过 max_bytes 时淘汰最久未使用的
+# - TTL：条目写入超过 ttl 秒后视为过期，下次读取时重新从底层存储获取
+# - mset/mdelete 先写底层存储，再使对应键失效；读取期间发生过失效时，
+#   这一批读到的结果不写入缓存，避免把旧值放回去
+class CachedDocStore(BaseStore[str, Document]):
+    def __init__(
+        self,
+        store: BaseStore[str, Document],
+        max_entries: int = 10_000,
+        max_bytes: int = 64 << 20,
+        ttl: Optional[float] = 300.0,
+    ):
+        self.store = store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (文档, 估算字节数, 过期时间)
+        self._entries: OrderedDict[str, tuple[Document, int, float]] = OrderedDict()
+        self._bytes = 0
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _lookup(self, keys: Sequence[str]) -> tuple[dict[str, Document], list[str]]:
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] < now:
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing.append(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+            return found, missing
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _fill(self, epoch: int, pairs: Sequence[tuple[str, Optional[Document]]]):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            for key, doc in pairs:
+                if doc is None:
+                    continue
+                if key in self._entries:
+                    self._remove(key)
+                size = document_size(doc)
+                self._entries[key] = (doc, size, expires)
+                self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, keys: Optional[Sequence[str]] = None) -> None:
+        # keys 为 None 时清空整个缓存
+        with self._lock:
+            self._epoch += 1
+            if keys is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[Document]]:
+        found, missing = self._lookup(keys)
+        if missing:
+            epoch = self._epoch
+            # 未命中的键去重后一次性从底层存储读取
+            missing = list(dict.fromkeys(missing))
+            fetched = self.store.mget(missing)
+            self._fill(epoch, list(zip(missing, fetched)))
+            found.update(zip(missing, fetched))
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, Document]]) -> None:
+        self.store.mset(key_value_pairs)
+        self.invalidate([key for key, _ in key_value_pairs])
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        self.store.mdelete(keys)
+        self.invalidate(keys)
+
+    def delete(self, keys: Sequence[str]) -> None:
+        self.mdelete(keys)
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        yield from self.store.yield_keys(prefix=prefix)
+
+    async def amget(self, keys: Sequence[str]) -> list[Optional[Document]]:
+        found, missing = self._lookup(keys)
+        if missing:
+            epoch = self._epoch
+            missing = list(dict.fromkeys(missing))
+            fetched = await self.store.amget(missing)
+            self._fill(epoch, list(zip(missing, fetched)))
+            found.update(zip(missing, fetched))
+        return [found.get(key) for key in keys]
+
+    async def amset(self, key_value_pairs: Sequence[tuple[str, Document]]) -> None:
+        await self.store.amset(key_value_pairs)
+        self.invalidate([key for key, _ in key_value_pairs])
+
+    async def amdelete(self, keys: Sequence[str]) -> None:
+        await self.store.amdelete(keys)
+        self.invalidate(keys)
+
+    async def adelete(self, keys: Sequence[str]) -> None:
+        await self.amdelete(keys)
+
+    async def ayield_keys(self, *, prefix: Optional[str] = None) -> AsyncIterator[str]:
+        async for key in self.store.ayield_keys(prefix=prefix):
+            yield key
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+if __name__ == "__main__":
+    store = CachedDocStore(PooledPostgresDocStore(connection), max_entries=1000)
+    keys = list(store.yield_keys())[:50]
+    # 模拟热点父文档被反复读取
+    for _ in range(3):
+        start = time.perf_counter()
+        for i in range(200):
+            store.mget(keys[i % 10 : i % 10 + 4])
+        print(f"200 mget calls: {time.perf_counter() - start:.3f}s {store.stats()}")
+    # 写回同样的内容：缓存中的这个键失效，下次读取回源
+    store.mset([(keys[0], store.mget(keys[:1])[0])])
+    store.mget(keys[:1])
+    print(store.stats())
@@ -0,0 +1,124 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_community.document_loaders import TextLoader
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+def make_batches(
+    texts: list[str], max_chars: int, max_batch_size: int
+) -> list[tuple[int, int]]:
+    # 按字符预算切分批次（nomic-embed-text 大约 4 个字符一个 token），
+    # 同时限制每批的条数；返回 [start, end) 下标区间，保证输出顺序与输入一致
+    batches = []
+    start, chars = 0, 0
+    for i, text in enumerate(texts):
+        size = len(text)
+        if i > start and (chars + size > max_chars or i - start >= max_batch_size):
+            batches.append((start, i))
+            start, chars = i, 0
+        chars += size
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+@dataclass
+class EmbedStats:
+    chunks: int
+    batches: int
+    retries: int
+    seconds: float
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.chunks} chunks in {self.batches} batches, {self.retries} retries, "
+            f"{self.seconds:.2f}s ({self.chunks_per_second:.1f} chunks/s)"
+        )
+
+
+# 并发、按大小自适应分批的 embed_documents
+# 输入按字符预算切成多批，通过有界线程池并发发给嵌入服务，失败的批次按指数退避重试
+class ConcurrentBatchEmbeddings(Embeddings):
+    def __init__(
+        self,
+        underlying: Embeddings,
+        max_chars: int = 32_000,
+        max_batch_size: int = 64,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.underlying = underlying
+        self.max_chars = max_chars
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.last_stats: Optional[EmbedStats] = None
+
+    @property
+    def model(self) -> str:
+        # 供 CachedEmbeddings 等包装器识别模型名
+        return getattr(self.underlying, "model", type(self.underlying).__name__)
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], int]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.underlying.embed_documents(texts), attempt
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        batches = make_batches(texts, self.max_chars, self.max_batch_size)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # executor.map 按提交顺序返回结果，拼接后即为输入顺序
+            results = list(
+                executor.map(
+                    lambda span: self._embed_batch(texts[span[0] : span[1]]), batches
+                )
+            )
+        embeddings = [vector for vectors, _ in results for vector in vectors]
+        self.last_stats = EmbedStats(
+            chunks=len(texts),
+            batches=len(batches),
+            retries=sum(retries for _, retries in results),
+            seconds=time.perf_counter() - start,
+        )
+        return embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.underlying.embed_query(text)
+
+
+if __name__ == "__main__":
+    docs = TextLoader("./resources/test.txt").load()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
+    texts = [chunk.page_content for chunk in text_splitter.split_documents(docs)]
+
+    ollama = OllamaEmbeddings(
+        base_url="http://localhost:11434", model="nomic-embed-text"
+    )
+
+    # 扫描不同的批大小与并发度，便于为嵌入服务器选择参数
+    for max_batch_size in (16, 64):
+        for max_workers in (1, 2, 4, 8):
+            embedder = ConcurrentBatchEmbeddings(
+                ollama, max_batch_size=max_batch_size, max_workers=max_workers
+            )
+            embedder.embed_documents(texts)
+            print(
+                f"batch={max_batch_size:<3} workers={max_workers}: "
+                f"{embedder.last_stats}"
+            )
@@ -2,6 +2,9 @@ from langchain_community.document_loaders import TextLoader
 from langchain_ollama import OllamaEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from ch2_embed_concurrent import ConcurrentBatchEmbeddings
+from ch2_embedding_cache import CachedEmbeddings
+
 if __name__ == "__main__":
     # Load the document
     loader = TextLoader("./resources/test.txt")
@@ -13,10 +16,18 @@ if __name__ == "__main__":
     chunks = text_splitter.split_documents(doc)  # Type of chunks is List[Document]
 
     ## Generate embeddings for each chunk
-    embedding_ollama_model = OllamaEmbeddings(
-        base_url="http://localhost:11434",
-        model="nomic-embed-text",
+    # Cache misses are split into size-bounded batches and sent concurrently;
+    # the persistent cache in front means unchanged chunks are not re-embedded
+    concurrent_model = ConcurrentBatchEmbeddings(
+        OllamaEmbeddings(
+            base_url="http://localhost:11434",
+            model="nomic-embed-text",
+        ),
+        max_chars=32_000,
+        max_batch_size=64,
+        max_workers=4,
     )
+    embedding_ollama_model = CachedEmbeddings(concurrent_model)
 
     # Input: list[str]
     # Output: embeddings, type is List[List[float]]
@@ -25,3 +36,6 @@ if __name__ == "__main__":
     ]  # chunk.page_content is the text of the chunk
     embeddings = embedding_ollama_model.embed_documents(texts=input_chunks)
     print(embeddings[0])
+    print(embedding_ollama_model.stats())
+    if concurrent_model.last_stats:  # None when every chunk was a cache hit
+        print(concurrent_model.last_stats)
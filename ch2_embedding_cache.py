@@ -0,0 +1,203 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+DEFAULT_CACHE_PATH = "./.cache/embeddings.sqlite"
+
+# SQLite 单条语句的参数个数有上限，查询时按此大小分组
+_SQL_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: list[float]) -> bytes:
+    # 以 float32 紧凑存储，768 维向量约 3KB
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+# 按内容寻址的持久化嵌入缓存
+# key = (模型名, sha256(文本))，值为 float32 向量；超过 max_entries 时按最近使用时间淘汰。
+# 包装任意 Embeddings，对调用方透明：未改动的语料重新索引时不再调用模型。
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        underlying: Embeddings,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = 200_000,
+        namespace: Optional[str] = None,
+    ):
+        self.underlying = underlying
+        self.max_entries = max_entries
+        # 默认用模型名作为命名空间，不同模型的向量互不混用
+        self.namespace = namespace or getattr(
+            underlying, "model", type(underlying).__name__
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embedding_cache_lru "
+            "ON embedding_cache (last_used)"
+        )
+        self._conn.commit()
+        (self._size,) = self._conn.execute(
+            "SELECT COUNT(*) FROM embedding_cache"
+        ).fetchone()
+
+    @property
+    def model(self) -> str:
+        # 供 SemanticRouter 等按模型名生成指纹的调用方识别底层模型
+        return getattr(self.underlying, "model", self.namespace)
+
+    def _lookup(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        found = {}
+        for i in range(0, len(hashes), _SQL_CHUNK):
+            group = hashes[i : i + _SQL_CHUNK]
+            placeholders = ",".join("?" * len(group))
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM embedding_cache "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *group],
+            ).fetchall()
+            found.update((h, unpack_vector(blob)) for h, blob in rows)
+        if found:
+            # 刷新命中项的使用时间，供 LRU 淘汰使用
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embedding_cache SET last_used = ? "
+                "WHERE model = ? AND text_hash = ?",
+                [(now, model, h) for h in found],
+            )
+        return found
+
+    def _store(self, model: str, items: dict[str, list[float]]) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embedding_cache "
+            "(model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(model, h, pack_vector(v), now) for h, v in items.items()],
+        )
+        self._size += len(items)
+        self._evict()
+
+    def _evict(self) -> None:
+        if self._size <= self.max_entries:
+            return
+        (self._size,) = self._conn.execute(
+            "SELECT COUNT(*) FROM embedding_cache"
+        ).fetchone()
+        excess = self._size - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embedding_cache WHERE rowid IN ("
+                "SELECT rowid FROM embedding_cache ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self._size -= excess
+
+    def _embed(self, model: str, texts: list[str], embed_fn) -> list[list[float]]:
+        hashes = [text_hash(t) for t in texts]
+        with self._lock:
+            cached = self._lookup(model, hashes)
+            self._conn.commit()
+
+        # 相同文本只嵌入一次
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        n_miss = sum(1 for h in hashes if h not in cached)
+        with self._lock:
+            self.hits += len(texts) - n_miss
+            self.misses += n_miss
+
+        if missing:
+            # 模型调用放在锁外，避免阻塞其他线程读取缓存
+            vectors = embed_fn(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._store(model, computed)
+                self._conn.commit()
+            cached.update(computed)
+        return [cached[h] for h in hashes]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(self.namespace, texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        # 有些模型对查询和文档使用不同的前缀，因此查询向量单独存放
+        return self._embed(
+            f"{self.namespace}#query",
+            [text],
+            lambda ts: [self.underlying.embed_query(ts[0])],
+        )[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "entries": self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def cached_ollama_embeddings(
+    model: str = "nomic-embed-text",
+    base_url: str = "http://localhost:11434",
+    path: str = DEFAULT_CACHE_PATH,
+) -> CachedEmbeddings:
+    return CachedEmbeddings(OllamaEmbeddings(base_url=base_url, model=model), path=path)
+
+
+if __name__ == "__main__":
+    embeddings = cached_ollama_embeddings()
+    texts = ["hello world", "the little prince", "hello world"]
+
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    print(f"first run: {time.perf_counter() - start:.3f}s", embeddings.stats())
+
+    # 第二次完全命中缓存，不会调用模型
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    print(f"second run: {time.perf_counter() - start:.3f}s", embeddings.stats())
@@ -0,0 +1,124 @@
+import hashlib
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+from langchain_core.documents import Document
+from psycopg_pool import ConnectionPool
+
+from ch2_pg_docstore import to_conninfo
+
+# 固定命名空间，保证同样的内容在任何机器上都生成同样的 doc_id
+DOC_ID_NAMESPACE = uuid.UUID("6f1c2b7e-3d0a-4c55-9a51-2f0d8c1e7b42")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_doc_id(source: str, digest: str, occurrence: int = 0) -> str:
+    # doc_id 只由来源文件、内容哈希和同内容出现的序号决定，
+    # 与分块在文件中的位置无关：在文件前面插入内容不会改变后面分块的 id
+    return str(uuid.uuid5(DOC_ID_NAMESPACE, f"{source}\0{digest}\0{occurrence}"))
+
+
+def assign_doc_ids(chunks: list[Document], source: str) -> list[tuple[str, str]]:
+    # 返回与 chunks 一一对应的 (doc_id, content_hash)
+    seen: Counter = Counter()
+    ids = []
+    for chunk in chunks:
+        digest = content_hash(chunk.page_content)
+        ids.append((chunk_doc_id(source, digest, seen[digest]), digest))
+        seen[digest] += 1
+    return ids
+
+
+@dataclass
+class ManifestDiff:
+    source: str
+    # 需要摘要、嵌入并写入的新分块
+    added: list[tuple[str, str, Document]] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    # 已经不存在的分块，需要从向量库和文档库中删除
+    removed: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.source}: {len(self.added)} added, "
+            f"{len(self.unchanged)} unchanged, {len(self.removed)} removed"
+        )
+
+
+# 索引清单：记录每个集合中每个来源文件当前已索引的分块 (doc_id, content_hash)，
+# 重新索引时与新的切分结果对比，只处理新增/删除的分块
+class IndexManifest:
+    def __init__(self, connection_string: str, collection: str, max_size: int = 2):
+        self.collection = collection
+        self.pool = ConnectionPool(
+            to_conninfo(connection_string), min_size=1, max_size=max_size, open=True
+        )
+        with self.pool.connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS index_manifest (
+                    collection TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (collection, doc_id)
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS index_manifest_source "
+                "ON index_manifest (collection, source)"
+            )
+
+    def indexed_ids(self, source: str) -> set[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT doc_id FROM index_manifest "
+                "WHERE collection = %s AND source = %s",
+                (self.collection, source),
+            ).fetchall()
+        return {doc_id for (doc_id,) in rows}
+
+    def diff(self, source: str, chunks: list[Document]) -> ManifestDiff:
+        existing = self.indexed_ids(source)
+        result = ManifestDiff(source)
+        current = set()
+        for (doc_id, digest), chunk in zip(assign_doc_ids(chunks, source), chunks):
+            current.add(doc_id)
+            if doc_id in existing:
+                result.unchanged.append(doc_id)
+            else:
+                result.added.append((doc_id, digest, chunk))
+        result.removed = sorted(existing - current)
+        return result
+
+    def apply(self, diff: ManifestDiff) -> None:
+        # 向量库和文档库写入成功之后再调用，中途失败时下次运行会重新处理这些分块
+        with self.pool.connection() as conn:
+            with conn.transaction(), conn.cursor() as cur:
+                if diff.removed:
+                    cur.execute(
+                        "DELETE FROM index_manifest "
+                        "WHERE collection = %s AND doc_id = ANY(%s)",
+                        (self.collection, diff.removed),
+                    )
+                if diff.added:
+                    cur.executemany(
+                        "INSERT INTO index_manifest "
+                        "(collection, source, doc_id, content_hash) "
+                        "VALUES (%s, %s, %s, %s) "
+                        "ON CONFLICT (collection, doc_id) DO UPDATE "
+                        "SET content_hash = EXCLUDED.content_hash, updated_at = now()",
+                        [
+                            (self.collection, diff.source, doc_id, digest)
+                            for doc_id, digest, _ in diff.added
+                        ],
+                    )
+
+    def close(self) -> None:
+        self.pool.close()
@@ -0,0 +1,206 @@
+import mmap
+import os
+import resource
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence
+
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from langchain_core.stores import BaseStore
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+# 已映射的文件及映射时的 (大小, 修改时间)，同一个版本的文件在进程内只映射一次
+_maps: dict[str, tuple[tuple[int, int], mmap.mmap]] = {}
+_maps_lock = threading.Lock()
+
+
+def _file_version(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+
+def open_versioned_mmap(path: str) -> tuple[mmap.mmap, tuple[int, int]]:
+    # 文件被替换或修改后重新映射；原地截断的文件继续通过旧映射读取会触发 SIGBUS，
+    # 所以旧映射直接关闭
+    path = os.path.abspath(path)
+    version = _file_version(path)
+    with _maps_lock:
+        cached = _maps.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1], version
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            version = (st.st_size, st.st_mtime_ns)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if cached is not None:
+            cached[1].close()
+        _maps[path] = (version, mm)
+        return mm, version
+
+
+def open_mmap(path: str) -> mmap.mmap:
+    return open_versioned_mmap(path)[0]
+
+
+def close_mmaps() -> None:
+    with _maps_lock:
+        for _, mm in _maps.values():
+            mm.close()
+        _maps.clear()
+
+
+@dataclass(frozen=True)
+class TextSpan:
+    # 文件中的一个分块：只记录 [start, end) 字节偏移，文本在需要时才从映射中读取；
+    # version 是切分时文件的 (大小, 修改时间)
+    source: str
+    start: int
+    end: int
+    version: tuple[int, int] = (0, 0)
+
+    @property
+    def page_content(self) -> str:
+        return open_mmap(self.source)[self.start : self.end].decode("utf-8")
+
+    @property
+    def metadata(self) -> dict:
+        return {"source": self.source, "start_byte": self.start, "end_byte": self.end}
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.page_content, metadata=self.metadata)
+
+
+def _char_boundary(mm: mmap.mmap, pos: int) -> int:
+    # 向前移动到 UTF-8 字符边界（跳过 10xxxxxx 形式的续字节）
+    while 0 < pos < len(mm) and mm[pos] & 0xC0 == 0x80:
+        pos -= 1
+    return pos
+
+
+def _pieces_with_offsets(text: str, splitter: TextSplitter) -> list[tuple[int, int]]:
+    # 把切分结果转换为窗口内的 [start, end) 字节偏移；
+    # 定位方式与 add_start_index 相同：从上一个分块末尾减去重叠长度处开始查找
+    overlap = getattr(splitter, "_chunk_overlap", 0)
+    spans = []
+    search_from = 0
+    byte_pos, char_pos = 0, 0
+    for piece in splitter.split_text(text):
+        char_start = text.find(piece, max(0, search_from))
+        if char_start < 0:
+            # 重叠部分比预计的长时退回到上一个分块的起点查找
+            char_start = text.find(piece, char_pos)
+        if char_start < 0:
+            raise ValueError(f"chunk not found in the source text: {piece[:50]!r}")
+        byte_pos += len(text[char_pos:char_start].encode("utf-8"))
+        char_pos = char_start
+        spans.append((byte_pos, byte_pos + len(piece.encode("utf-8"))))
+        search_from = max(char_start + 1, char_start + len(piece) - overlap)
+    return spans
+
+
+def iter_spans(
+    path: str, splitter: TextSplitter, window_bytes: int = 4 << 20
+) -> Iterator[TextSpan]:
+    # 在映射的文件上按窗口切分，每次只解码一个窗口，产出的分块只是字节区间；
+    # 窗口内最后一个分块可能被截断，下一个窗口从它的起点开始重新切分
+    # 空文件无法映射，与 TextLoader 一样不产生任何分块
+    if os.path.getsize(path) == 0:
+        return
+    mm, version = open_versioned_mmap(path)
+    size = len(mm)
+    pos = 0
+    window = window_bytes
+    while pos < size:
+        end = size if pos + window >= size else _char_boundary(mm, pos + window)
+        pieces = _pieces_with_offsets(mm[pos:end].decode("utf-8"), splitter)
+        if end < size:
+            if len(pieces) <= 1:
+                # 窗口内连一个完整分块都没有，扩大窗口重试
+                window *= 2
+                continue
+            tail_start, _ = pieces.pop()
+        for start, stop in pieces:
+            yield TextSpan(path, pos + start, pos + stop, version)
+        if end == size:
+            return
+        pos += tail_start
+        window = window_bytes
+
+
+# 只保存字节区间的文档存储：底层存储中保存的是空 page_content 加上区间元数据，
+# mget 时再从映射的源文件中读取文本；区间记录的是切分时的文件版本，
+# 源文件之后被修改或删除过的区间视为缺失（返回 None）
+class SpanDocStore(BaseStore[str, Document]):
+    def __init__(self, store: BaseStore[str, Document]):
+        self.store = store
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, TextSpan]]) -> None:
+        self.store.mset(
+            [
+                (
+                    key,
+                    Document(
+                        page_content="",
+                        metadata={
+                            **span.metadata,
+                            "file_version": list(span.version),
+                        },
+                    ),
+                )
+                for key, span in key_value_pairs
+            ]
+        )
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[Document]]:
+        docs = []
+        for stored in self.store.mget(keys):
+            if stored is None:
+                docs.append(None)
+                continue
+            meta = stored.metadata
+            try:
+                mm, version = open_versioned_mmap(meta["source"])
+            except FileNotFoundError:
+                docs.append(None)
+                continue
+            if meta.get("file_version") != list(version):
+                docs.append(None)
+                continue
+            # 文本从刚检查过版本的映射中读取，不再重新打开文件
+            span = TextSpan(meta["source"], meta["start_byte"], meta["end_byte"])
+            text = mm[span.start : span.end].decode("utf-8")
+            docs.append(Document(page_content=text, metadata=span.metadata))
+        return docs
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        self.store.mdelete(keys)
+
+    def yield_keys(self, *, prefix: Optional[str] = None) -> Iterator[str]:
+        yield from self.store.yield_keys(prefix=prefix)
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    from langchain_core.stores import InMemoryStore
+
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    path = paths[0] if paths else "./resources/test.txt"
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=20)
+
+    if "--baseline" in sys.argv:
+        # 对照组：整个文件读入一个字符串，再把每个分块复制一份
+        chunks = splitter.split_documents(TextLoader(path).load())
+        print(f"TextLoader: {len(chunks)} chunks, peak RSS {peak_rss_mb():.1f} MB")
+    else:
+        spans = list(iter_spans(path, splitter))
+        print(f"mmap spans: {len(spans)} chunks, peak RSS {peak_rss_mb():.1f} MB")
+
+        store = SpanDocStore(InMemoryStore())
+        store.mset([(str(i), span) for i, span in enumerate(spans)])
+        print(store.mget(["0"])[0].page_content[:200])
@@ -0,0 +1,535 @@
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+import psycopg
+from langchain_core.documents import Document
+from langchain_ollama import OllamaEmbeddings
+from langchain_postgres.vectorstores import PGVector
+from psycopg import sql
+from psycopg.types.json import Jsonb
+from psycopg_pool import ConnectionPool
+
+from ch2_embedding_cache import CachedEmbeddings
+from ch2_pg_docstore import connection, to_conninfo
+
+# PGVector 默认的表结构：所有集合共用 langchain_pg_embedding，embedding 列不带维度
+EMBEDDING_TABLE = "langchain_pg_embedding"
+COLLECTION_TABLE = "langchain_pg_collection"
+
+# 距离类型 -> (索引操作符类, 距离运算符)
+DISTANCES = {
+    "cosine": ("vector_cosine_ops", "<=>"),
+    "l2": ("vector_l2_ops", "<->"),
+    "ip": ("vector_ip_ops", "<#>"),
+}
+
+
+def to_vector_literal(vector: Sequence[float]) -> str:
+    return "[" + ",".join(f"{x:.7g}" for x in vector) + "]"
+
+
+def index_name(method: str, collection_id: str) -> str:
+    # 索引名不能超过 63 字节，用集合 uuid 的前缀区分
+    return f"ix_emb_{method}_{collection_id.replace('-', '')[:16]}"
+
+
+@dataclass
+class QueryReport:
+    collection: str
+    k: int
+    rows: int
+    seconds: float
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    filter: Optional[dict] = None
+    # 以下字段只有 explain 时才有
+    planning_ms: Optional[float] = None
+    execution_ms: Optional[float] = None
+    indexes: list[str] = field(default_factory=list)
+    node_types: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        knobs = ", ".join(
+            f"{name}={value}"
+            for name, value in (("ef_search", self.ef_search), ("probes", self.probes))
+            if value is not None
+        )
+        text = (
+            f"{self.collection} k={self.k} {knobs or 'defaults'}: {self.rows} rows "
+            f"in {self.seconds * 1000:.2f}ms"
+        )
+        if self.execution_ms is not None:
+            scan = ", ".join(self.indexes) or "seq scan"
+            text += (
+                f" (planning {self.planning_ms:.2f}ms, execution "
+                f"{self.execution_ms:.2f}ms, {scan})"
+            )
+        return text
+
+
+def _walk_plan(node: dict, report: QueryReport) -> None:
+    report.node_types.append(node["Node Type"])
+    if "Index Name" in node:
+        report.indexes.append(node["Index Name"])
+    for child in node.get("Plans", []):
+        _walk_plan(child, report)
+
+
+# PGVector 集合的 ANN 索引管理
+# - PGVector 的 embedding 列没有固定维度，无法直接建 HNSW/IVFFlat 索引；
+#   这里按集合建部分表达式索引：((embedding::vector(dim)) ops) WHERE collection_id = ...
+# - 查询必须使用相同的表达式才能命中索引，所以 search/explain 自己生成 SQL，
+#   并在同一个事务里用 set_config(..., true) 设置本次查询的 ef_search / probes
+# - 元数据过滤用 cmetadata @> 条件，可以命中 jsonb_path_ops 的 GIN 索引
+class PGVectorIndexManager:
+    def __init__(
+        self,
+        connection_string: str,
+        distance: str = "cosine",
+        min_size: int = 1,
+        max_size: int = 4,
+    ):
+        self.conninfo = to_conninfo(connection_string)
+        self.opclass, self.operator = DISTANCES[distance]
+        self.pool = ConnectionPool(
+            self.conninfo, min_size=min_size, max_size=max_size, open=True
+        )
+        self._collections: dict[str, tuple[str, int]] = {}
+
+    def collection(self, name: str) -> tuple[str, int]:
+        # 返回 (集合 uuid, 向量维度)
+        if name not in self._collections:
+            with self.pool.connection() as conn:
+                row = conn.execute(
+                    f"SELECT c.uuid::text, vector_dims(e.embedding) "
+                    f"FROM {COLLECTION_TABLE} c JOIN {EMBEDDING_TABLE} e "
+                    f"ON e.collection_id = c.uuid WHERE c.name = %s LIMIT 1",
+                    (name,),
+                ).fetchone()
+            if row is None:
+                raise ValueError(f"collection {name!r} does not exist or is empty")
+            self._collections[name] = row
+        return self._collections[name]
+
+    def _vector_expr(self, dim: int) -> sql.Composable:
+        return sql.SQL("(embedding::vector({}))").format(sql.Literal(dim))
+
+    def _ddl(self, statement: sql.Composable) -> None:
+        # CREATE INDEX CONCURRENTLY 不能在事务中执行，使用独立的自动提交连接
+        with psycopg.connect(self.conninfo, autocommit=True) as conn:
+            conn.execute(statement)
+
+    def create_hnsw_index(
+        self,
+        collection: str,
+        m: int = 16,
+        ef_construction: int = 64,
+        concurrently: bool = True,
+    ) -> str:
+        collection_id, dim = self.collection(collection)
+        name = index_name("hnsw", collection_id)
+        self._ddl(
+            sql.SQL(
+                "CREATE INDEX {} IF NOT EXISTS {} ON {} USING hnsw ({} {}) "
+                "WITH (m = {}, ef_construction = {}) WHERE collection_id = {}"
+            ).format(
+                sql.SQL("CONCURRENTLY" if concurrently else ""),
+                sql.Identifier(name),
+                sql.Identifier(EMBEDDING_TABLE),
+                self._vector_expr(dim),
+                sql.SQL(self.opclass),
+                sql.Literal(m),
+                sql.Literal(ef_construction),
+                sql.Literal(collection_id),
+            )
+        )
+        return name
+
+    def create_ivfflat_index(
+        self, collection: str, lists: Optional[int] = None, concurrently: bool = True
+    ) -> str:
+        collection_id, dim = self.collection(collection)
+        if lists is None:
+            # pgvector 的建议：百万行以内取 rows / 1000，以上取 sqrt(rows)
+            rows = self.count(collection)
+            lists = max(1, rows // 1000 if rows <= 1_000_000 else int(rows**0.5))
+        name = index_name("ivfflat", collection_id)
+        self._ddl(
+            sql.SQL(
+                "CREATE INDEX {} IF NOT EXISTS {} ON {} USING ivfflat ({} {}) "
+                "WITH (lists = {}) WHERE collection_id = {}"
+            ).format(
+                sql.SQL("CONCURRENTLY" if concurrently else ""),
+                sql.Identifier(name),
+                sql.Identifier(EMBEDDING_TABLE),
+                self._vector_expr(dim),
+                sql.SQL(self.opclass),
+                sql.Literal(lists),
+                sql.Literal(collection_id),
+            )
+        )
+        return name
+
+    def create_metadata_indexes(
+        self, collection: str, keys: Sequence[str] = ("doc_id",)
+    ) -> list[str]:
+        # GIN(jsonb_path_ops) 支持任意 cmetadata @> {...} 过滤；
+        # 常用的等值键（如 doc_id）再建 btree 表达式索引，按键查行更快
+        collection_id, _ = self.collection(collection)
+        names = ["ix_cmetadata_gin"]
+        self._ddl(
+            sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cmetadata_gin "
+                "ON {} USING gin (cmetadata jsonb_path_ops)"
+            ).format(sql.Identifier(EMBEDDING_TABLE))
+        )
+        for key in keys:
+            name = index_name(f"meta_{key}"[:20], collection_id)
+            self._ddl(
+                sql.SQL(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} "
+                    "((cmetadata ->> {})) WHERE collection_id = {}"
+                ).format(
+                    sql.Identifier(name),
+                    sql.Identifier(EMBEDDING_TABLE),
+                    sql.Literal(key),
+                    sql.Literal(collection_id),
+                )
+            )
+            names.append(name)
+        return names
+
+    def drop_index(self, name: str) -> None:
+        self._ddl(
+            sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name))
+        )
+
+    def list_indexes(self, collection: str) -> list[dict]:
+        collection_id, _ = self.collection(collection)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT i.indexname, i.indexdef, "
+                "pg_size_pretty(pg_relation_size(c.oid)) "
+                "FROM pg_indexes i JOIN pg_class c ON c.relname = i.indexname "
+                "WHERE i.tablename = %s "
+                "AND (i.indexdef LIKE %s OR i.indexdef NOT LIKE %s)",
+                (EMBEDDING_TABLE, f"%{collection_id}%", "%collection_id =%"),
+            ).fetchall()
+        return [{"name": n, "definition": d, "size": s} for n, d, s in rows]
+
+    def count(self, collection: str) -> int:
+        collection_id, _ = self.collection(collection)
+        with self.pool.connection() as conn:
+            return conn.execute(
+                f"SELECT count(*) FROM {EMBEDDING_TABLE} WHERE collection_id = %s",
+                (collection_id,),
+            ).fetchone()[0]
+
+    def analyze(self) -> None:
+        self._ddl(sql.SQL("ANALYZE {}").format(sql.Identifier(EMBEDDING_TABLE)))
+
+    def _search_sql(
+        self, dim: int, filtered: bool, query: str = "%(q)s"
+    ) -> sql.Composed:
+        return sql.SQL(
+            "SELECT id, document, cmetadata, "
+            "{vec} {op} {query}::vector({dim}) AS distance "
+            "FROM {table} WHERE collection_id = %(cid)s {filter} "
+            "ORDER BY {vec} {op} {query}::vector({dim}) LIMIT %(k)s"
+        ).format(
+            vec=self._vector_expr(dim),
+            query=sql.SQL(query),
+            op=sql.SQL(self.operator),
+            dim=sql.Literal(dim),
+            table=sql.Identifier(EMBEDDING_TABLE),
+            filter=sql.SQL("AND cmetadata @> %(filter)s" if filtered else ""),
+        )
+
+    def _configure(self, conn, ef_search, probes, exact) -> None:
+        # set_config(..., true) 等价于 SET LOCAL，只在当前事务内生效
+        settings = {
+            "hnsw.ef_search": ef_search,
+            "ivfflat.probes": probes,
+            "enable_indexscan": "off" if exact else None,
+        }
+        for name, value in settings.items():
+            if value is not None:
+                conn.execute("SELECT set_config(%s, %s, true)", (name, str(value)))
+
+    def search(
+        self,
+        collection: str,
+        query_vector: Sequence[float],
+        k: int = 4,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filter: Optional[dict] = None,
+        exact: bool = False,
+    ) -> tuple[list[tuple[Document, float]], QueryReport]:
+        collection_id, dim = self.collection(collection)
+        params = {
+            "q": to_vector_literal(query_vector),
+            "cid": collection_id,
+            "k": k,
+            "filter": Jsonb(filter) if filter else None,
+        }
+        start = time.perf_counter()
+        with self.pool.connection() as conn, conn.transaction():
+            self._configure(conn, ef_search, probes, exact)
+            rows = conn.execute(self._search_sql(dim, bool(filter)), params).fetchall()
+        report = QueryReport(
+            collection,
+            k,
+            len(rows),
+            time.perf_counter() - start,
+            ef_search=ef_search,
+            probes=probes,
+            filter=filter,
+        )
+        results = [
+            (Document(id=id_, page_content=document or "", metadata=metadata), distance)
+            for id_, document, metadata, distance in rows
+        ]
+        return results, report
+
+    def batch_search(
+        self,
+        collection: str,
+        query_vectors: Sequence[Sequence[float]],
+        k: int = 4,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filter: Optional[dict] = None,
+    ) -> tuple[list[list[tuple[Document, float]]], QueryReport]:
+        # 一批查询向量通过 unnest + LATERAL 在一条 SQL 中完成，只有一次往返；
+        # 每个查询在 LATERAL 子查询里仍然走同一个 ANN 索引
+        collection_id, dim = self.collection(collection)
+        params = {
+            "qs": [to_vector_literal(v) for v in query_vectors],
+            "cid": collection_id,
+            "k": k,
+            "filter": Jsonb(filter) if filter else None,
+        }
+        query = sql.SQL(
+            "SELECT q.ord, e.id, e.document, e.cmetadata, e.distance "
+            "FROM unnest(%(qs)s::text[]) WITH ORDINALITY AS q(vec, ord) "
+            "CROSS JOIN LATERAL ({}) e ORDER BY q.ord, e.distance"
+        ).format(self._search_sql(dim, bool(filter), query="q.vec"))
+        start = time.perf_counter()
+        with self.pool.connection() as conn, conn.transaction():
+            self._configure(conn, ef_search, probes, False)
+            rows = conn.execute(query, params).fetchall()
+        report = QueryReport(
+            collection,
+            k,
+            len(rows),
+            time.perf_counter() - start,
+            ef_search=ef_search,
+            probes=probes,
+            filter=filter,
+        )
+        results = [[] for _ in query_vectors]
+        for ord_, id_, document, metadata, distance in rows:
+            doc = Document(id=id_, page_content=document or "", metadata=metadata)
+            results[ord_ - 1].append((doc, distance))
+        return results, report
+
+    def explain(
+        self,
+        collection: str,
+        query_vector: Sequence[float],
+        k: int = 4,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        filter: Optional[dict] = None,
+    ) -> tuple[QueryReport, dict]:
+        collection_id, dim = self.collection(collection)
+        params = {
+            "q": to_vector_literal(query_vector),
+            "cid": collection_id,
+            "k": k,
+            "filter": Jsonb(filter) if filter else None,
+        }
+        query = sql.SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ") + self._search_sql(
+            dim, bool(filter)
+        )
+        start = time.perf_counter()
+        with self.pool.connection() as conn, conn.transaction():
+            self._configure(conn, ef_search, probes, False)
+            plan = conn.execute(query, params).fetchone()[0]
+        plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+        report = QueryReport(
+            collection,
+            k,
+            plan["Plan"].get("Actual Rows", 0),
+            time.perf_counter() - start,
+            ef_search=ef_search,
+            probes=probes,
+            filter=filter,
+            planning_ms=plan.get("Planning Time"),
+            execution_ms=plan.get("Execution Time"),
+        )
+        _walk_plan(plan["Plan"], report)
+        return report, plan
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+# 相似度检索走 PGVectorIndexManager 生成的 SQL 的 PGVector：
+# PGVector 自己的查询是 ORDER BY embedding <=> q，不带 ::vector(dim)，命中不了上面的
+# 部分表达式索引。写入、删除和 MMR 仍由 PGVector 处理；带 $ 操作符的过滤条件
+# 无法转换成 @>，以及集合还没有数据时，也退回 PGVector 的查询
+class IndexedPGVector(PGVector):
+    def __init__(
+        self,
+        *args: Any,
+        index_manager: PGVectorIndexManager,
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.index_manager = index_manager
+        self.ef_search = ef_search
+        self.probes = probes
+
+    def _use_index(self, filter: Optional[dict]) -> bool:
+        if filter and any(
+            key.startswith("$") or isinstance(value, dict)
+            for key, value in filter.items()
+        ):
+            return False
+        try:
+            self.index_manager.collection(self.collection_name)
+        except ValueError:
+            return False
+        return True
+
+    def _index_search(
+        self, embedding: list[float], k: int, filter: Optional[dict]
+    ) -> list[tuple[Document, float]]:
+        results, _ = self.index_manager.search(
+            self.collection_name,
+            embedding,
+            k,
+            ef_search=self.ef_search,
+            probes=self.probes,
+            filter=filter,
+        )
+        return results
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None
+    ) -> list[tuple[Document, float]]:
+        if not self._use_index(filter):
+            return super().similarity_search_with_score_by_vector(embedding, k, filter)
+        return self._index_search(embedding, k, filter)
+
+    async def asimilarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None
+    ) -> list[tuple[Document, float]]:
+        # 索引管理器使用同步连接池，异步检索在线程中执行
+        if not await asyncio.to_thread(self._use_index, filter):
+            return await super().asimilarity_search_with_score_by_vector(
+                embedding, k, filter
+            )
+        return await asyncio.to_thread(self._index_search, embedding, k, filter)
+
+
+def recall_benchmark(
+    manager: PGVectorIndexManager,
+    collection: str,
+    query_vectors: list[list[float]],
+    k: int = 10,
+    ef_search_values: Sequence[int] = (),
+    probes_values: Sequence[int] = (),
+    filter: Optional[dict] = None,
+) -> None:
+    # 以关闭索引扫描的精确搜索为基准，比较不同 ef_search / probes 的召回和延迟
+    truth, exact_seconds = [], 0.0
+    for vector in query_vectors:
+        results, report = manager.search(
+            collection, vector, k, filter=filter, exact=True
+        )
+        truth.append({doc.id for doc, _ in results})
+        exact_seconds += report.seconds
+    n = len(query_vectors)
+    print(f"exact: {exact_seconds / n * 1000:.2f}ms/query")
+
+    settings = [{"ef_search": v} for v in ef_search_values]
+    settings += [{"probes": v} for v in probes_values]
+    for knobs in settings:
+        hits, seconds = 0, 0.0
+        for vector, expected in zip(query_vectors, truth):
+            results, report = manager.search(
+                collection, vector, k, filter=filter, **knobs
+            )
+            hits += len({doc.id for doc, _ in results} & expected)
+            seconds += report.seconds
+        total = sum(len(t) for t in truth) or 1
+        name, value = next(iter(knobs.items()))
+        print(
+            f"{name}={value:<4} recall@{k}={hits / total:.3f} "
+            f"{seconds / n * 1000:.2f}ms/query"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="管理 PGVector 集合的 ANN 索引")
+    parser.add_argument("collection", help="PGVector 集合名，例如 summaries")
+    parser.add_argument(
+        "action", choices=["hnsw", "ivfflat", "metadata", "list", "drop", "bench"]
+    )
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--keys", nargs="*", default=["doc_id"], help="元数据键")
+    parser.add_argument("--name", help="drop 时要删除的索引名")
+    parser.add_argument("--query", action="append", help="bench 使用的查询")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[10, 40, 100])
+    parser.add_argument("--probes", type=int, nargs="*", default=[])
+    parser.add_argument("--filter", type=json.loads, help='例如 {"doc_id": "..."}')
+    args = parser.parse_args()
+
+    manager = PGVectorIndexManager(connection)
+    if args.action == "hnsw":
+        print(manager.create_hnsw_index(args.collection, args.m, args.ef_construction))
+    elif args.action == "ivfflat":
+        print(manager.create_ivfflat_index(args.collection, args.lists))
+    elif args.action == "metadata":
+        print(manager.create_metadata_indexes(args.collection, args.keys))
+    elif args.action == "drop":
+        manager.drop_index(args.name)
+    elif args.action == "list":
+        for index in manager.list_indexes(args.collection):
+            print(f"{index['name']} ({index['size']}): {index['definition']}")
+    else:
+        manager.analyze()
+        embeddings = CachedEmbeddings(
+            OllamaEmbeddings(
+                base_url="http://localhost:11434", model="nomic-embed-text"
+            )
+        )
+        queries = args.query or ["Why does the prince love the rose?"]
+        vectors = embeddings.embed_documents(queries)
+        for ef_search in args.ef_search or [None]:
+            report, _ = manager.explain(
+                args.collection, vectors[0], args.k, ef_search, filter=args.filter
+            )
+            print(report)
+        recall_benchmark(
+            manager,
+            args.collection,
+            vectors,
+            args.k,
+            args.ef_search,
+            args.probes,
+            args.filter,
+        )
+    manager.close()
@@ -0,0 +1,204 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from langchain_core.documents import Document
+from langchain_ollama import ChatOllama
+
+from ch2_summary_cache import CachedSummarizer
+
+DEFAULT_JOURNAL_PATH = "./.cache/summary_journal.sqlite"
+
+
+# 摘要任务日志：每完成（或失败）一个分块就持久化一条记录，
+# 进程崩溃或被中断后，下次运行同一个 run_id 会跳过已完成的分块；
+# 每条记录带上摘要缓存键（模型、提示模板、分块哈希、temperature），键不一致的记录视为未完成
+class SummaryJournal:
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # 每次提交都落盘，保证断电后日志中记录的摘要仍然存在
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS journal_runs (
+                run_id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS journal_entries (
+                run_id TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                summary_key TEXT,
+                status TEXT NOT NULL,
+                summary TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                finished_at REAL NOT NULL,
+                PRIMARY KEY (run_id, doc_id)
+            );
+            """
+        )
+        # 旧版本创建的日志表没有 summary_key 列，其中的记录都会被重新处理
+        columns = [
+            row[1] for row in self._conn.execute("PRAGMA table_info(journal_entries)")
+        ]
+        if "summary_key" not in columns:
+            self._conn.execute(
+                "ALTER TABLE journal_entries ADD COLUMN summary_key TEXT"
+            )
+        self._conn.commit()
+
+    def start(self, run_id: str, total: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO journal_runs (run_id, total, started_at, updated_at) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (run_id) DO UPDATE SET total = ?, updated_at = ?",
+                (run_id, total, now, now, total, now),
+            )
+            self._conn.commit()
+
+    def completed(self, run_id: str) -> dict[str, tuple[Optional[str], str]]:
+        # 返回 {doc_id: (摘要缓存键, 摘要)}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, summary_key, summary FROM journal_entries "
+                "WHERE run_id = ? AND status = 'done'",
+                (run_id,),
+            ).fetchall()
+        return {doc_id: (key, summary) for doc_id, key, summary in rows}
+
+    def record(
+        self, run_id: str, doc_id: str, key=None, summary=None, error=None
+    ) -> None:
+        status = "done" if error is None else "failed"
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO journal_entries "
+                "(run_id, doc_id, summary_key, status, summary, error, finished_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, doc_id) DO UPDATE SET "
+                "summary_key = excluded.summary_key, "
+                "status = excluded.status, summary = excluded.summary, "
+                "error = excluded.error, finished_at = excluded.finished_at, "
+                "attempts = journal_entries.attempts + 1",
+                (run_id, doc_id, key, status, summary, error, now),
+            )
+            self._conn.execute(
+                "UPDATE journal_runs SET updated_at = ? WHERE run_id = ?",
+                (now, run_id),
+            )
+            self._conn.commit()
+
+    def progress(self, run_id: str) -> dict:
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT total FROM journal_runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM journal_entries "
+                    "WHERE run_id = ? GROUP BY status",
+                    (run_id,),
+                ).fetchall()
+            )
+        return {
+            "total": total[0] if total else 0,
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SummarizationIncomplete(RuntimeError):
+    pass
+
+
+# 可断点续跑的批量摘要
+# - 已记录在日志中、缓存键一致的分块直接跳过，其余分块交给 CachedSummarizer：
+#   先查摘要缓存，再以 max_concurrency 并发调用 Ollama
+# - 每个分块完成后立即写入日志和缓存；失败的分块记录错误，下次运行时重试
+class ResumableSummarizer:
+    def __init__(
+        self,
+        summarizer: CachedSummarizer,
+        journal: SummaryJournal,
+        max_concurrency: int = 4,
+        log_every: int = 10,
+    ):
+        self.summarizer = summarizer
+        self.journal = journal
+        self.max_concurrency = max_concurrency
+        self.log_every = log_every
+
+    def run(
+        self, run_id: str, items: list[tuple[str, Document]], config=None
+    ) -> list[str]:
+        self.journal.start(run_id, len(items))
+        keys = {doc_id: self.summarizer.key_for(chunk) for doc_id, chunk in items}
+        # 换了模型或提示模板后，日志中的旧摘要与当前的缓存键不一致，需要重新生成
+        results = {
+            doc_id: summary
+            for doc_id, (key, summary) in self.journal.completed(run_id).items()
+            if keys.get(doc_id) == key
+        }
+        pending = [item for item in items if item[0] not in results]
+        if results:
+            print(f"[{run_id}] resuming: {len(results)}/{len(items)} already done")
+
+        # 之前的运行（可能属于别的 run_id）已经生成过的摘要直接从缓存取，
+        # 相同内容的分块只生成一次
+        failed = 0
+        start = time.perf_counter()
+        config = {**(config or {}), "max_concurrency": self.max_concurrency}
+        outputs = self.summarizer.batch_as_completed(
+            [chunk for _, chunk in pending], config, return_exceptions=True
+        )
+        for n, (i, output) in enumerate(outputs, start=1):
+            doc_id, _ = pending[i]
+            if isinstance(output, Exception):
+                failed += 1
+                self.journal.record(run_id, doc_id, error=repr(output))
+            else:
+                results[doc_id] = output
+                self.journal.record(run_id, doc_id, keys[doc_id], summary=output)
+            if n % self.log_every == 0 or n == len(pending):
+                elapsed = time.perf_counter() - start
+                rate = n / elapsed if elapsed > 0 else 0.0
+                eta = (len(pending) - n) / rate if rate > 0 else 0.0
+                print(
+                    f"[{run_id}] {len(results)}/{len(items)} done, {failed} failed, "
+                    f"{rate:.2f} chunks/s, eta {eta:.0f}s"
+                )
+
+        if failed:
+            raise SummarizationIncomplete(
+                f"{failed} chunks failed in run {run_id!r}; rerun to retry them"
+            )
+        return [results[doc_id] for doc_id, _ in items]
+
+
+if __name__ == "__main__":
+    llm = ChatOllama(base_url="http://localhost:11434", model="gemma3:12b")
+    journal = SummaryJournal()
+    runner = ResumableSummarizer(CachedSummarizer(llm), journal, max_concurrency=2)
+
+    items = [
+        (f"demo-{i}", Document(page_content=f"Chapter {i} of the little prince."))
+        for i in range(6)
+    ]
+    # 中途按 Ctrl+C 中断后再次运行，会从中断处继续
+    summaries = runner.run("demo", items)
+    print(journal.progress("demo"))
+    print(summaries[0])
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_ollama import ChatOllama
+
+DEFAULT_CACHE_PATH = "./.cache/summaries.sqlite"
+
+
+def summary_key(model: str, template: str, chunk_hash: str, temperature) -> str:
+    return hashlib.sha256(
+        json.dumps([model, template, chunk_hash, temperature]).encode("utf-8")
+    ).hexdigest()
+
+
+# 持久化的 LLM 响应缓存，专门用于分块摘要
+# key = (模型, 提示模板, 分块内容哈希, temperature)，超过 max_entries 时按最近使用时间淘汰
+class SummaryCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS summary_cache_lru ON summary_cache (last_used)"
+        )
+        self._conn.commit()
+        (self._size,) = self._conn.execute(
+            "SELECT COUNT(*) FROM summary_cache"
+        ).fetchone()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                group = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, summary FROM summary_cache "
+                    f"WHERE key IN ({','.join('?' * len(group))})",
+                    group,
+                ).fetchall()
+                found.update(rows)
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE summary_cache SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self._conn.commit()
+        return found
+
+    def put(self, key: str, summary: str) -> None:
+        # 每条结果单独提交：批处理中途崩溃时已完成的摘要不会丢失
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO summary_cache (key, summary, last_used) "
+                "VALUES (?, ?, ?)",
+                (key, summary, time.time()),
+            )
+            if cur.rowcount:
+                self._size += 1
+            else:
+                self._conn.execute(
+                    "UPDATE summary_cache SET summary = ?, last_used = ? WHERE key = ?",
+                    (summary, time.time(), key),
+                )
+            if self._size > self.max_entries:
+                excess = self._size - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM summary_cache WHERE key IN ("
+                    "SELECT key FROM summary_cache ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._size -= excess
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": self._size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# 带缓存的批量摘要：命中缓存的分块直接复用之前的摘要，
+# 未命中的分块并发生成，每完成一条就写入缓存
+class CachedSummarizer:
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        prompt_text: str = "Summarize the following document:\n\n{doc}",
+        cache: Optional[SummaryCache] = None,
+        max_concurrency: int = 4,
+    ):
+        self.llm = llm
+        self.prompt_text = prompt_text
+        self.cache = cache or SummaryCache()
+        self.max_concurrency = max_concurrency
+        self.chain = (
+            {"doc": lambda x: x.page_content}
+            | ChatPromptTemplate.from_template(prompt_text)
+            | llm
+            | StrOutputParser()
+        )
+
+    def key_for(self, chunk: Document) -> str:
+        chunk_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        return summary_key(
+            getattr(self.llm, "model", type(self.llm).__name__),
+            self.prompt_text,
+            chunk_hash,
+            getattr(self.llm, "temperature", None),
+        )
+
+    def batch_as_completed(
+        self, chunks: list[Document], config=None, return_exceptions: bool = False
+    ) -> Iterator[tuple[int, Union[str, Exception]]]:
+        # 产出 (分块下标, 摘要)：先产出命中缓存的分块，再按完成顺序产出新生成的摘要
+        keys = [self.key_for(chunk) for chunk in chunks]
+        cached = self.cache.get_many(keys)
+
+        # 相同内容的分块只生成一次摘要
+        pending: dict[str, list[int]] = {}
+        for i, key in enumerate(keys):
+            if key not in cached:
+                pending.setdefault(key, []).append(i)
+        n_miss = sum(len(indexes) for indexes in pending.values())
+        self.cache.hits += len(keys) - n_miss
+        self.cache.misses += n_miss
+
+        for i, key in enumerate(keys):
+            if key in cached:
+                yield i, cached[key]
+        if pending:
+            pending_keys = list(pending)
+            config = {**(config or {}), "max_concurrency": self.max_concurrency}
+            for j, summary in self.chain.batch_as_completed(
+                [chunks[pending[key][0]] for key in pending_keys],
+                config,
+                return_exceptions=return_exceptions,
+            ):
+                if not isinstance(summary, Exception):
+                    self.cache.put(pending_keys[j], summary)
+                for i in pending[pending_keys[j]]:
+                    yield i, summary
+
+    def batch(self, chunks: list[Document], config=None) -> list[str]:
+        summaries = [""] * len(chunks)
+        for i, summary in self.batch_as_completed(chunks, config):
+            summaries[i] = summary
+        return summaries
+
+
+if __name__ == "__main__":
+    llm = ChatOllama(base_url="http://localhost:11434", model="gemma3:12b")
+    summarizer = CachedSummarizer(llm)
+    chunks = [
+        Document(page_content="The little prince lives on asteroid B-612."),
+        Document(page_content="The fox asks the little prince to tame him."),
+    ]
+
+    start = time.perf_counter()
+    summarizer.batch(chunks)
+    print(f"first run: {time.perf_counter() - start:.2f}s", summarizer.cache.stats())
+
+    # 第二次直接从缓存读取，不再调用模型
+    start = time.perf_counter()
+    print(summarizer.batch(chunks))
+    print(f"second run: {time.perf_counter() - start:.2f}s", summarizer.cache.stats())
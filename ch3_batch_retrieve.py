@@ -0,0 +1,157 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain.retrievers.multi_vector import MultiVectorRetriever, SearchType
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_ollama import OllamaEmbeddings
+from langchain_postgres.vectorstores import PGVector
+
+from ch2_embedding_cache import CachedEmbeddings
+from ch2_pg_docstore import PooledPostgresDocStore, connection
+from ch2_pgvector_index import PGVectorIndexManager
+
+
+@dataclass
+class BatchRetrieveStats:
+    queries: int = 0
+    embed_seconds: float = 0.0
+    search_seconds: float = 0.0
+    mget_seconds: float = 0.0
+    # 所有查询命中的父文档引用数，以及去重后实际 mget 的键数
+    parent_refs: int = 0
+    unique_parents: int = 0
+
+    def __str__(self) -> str:
+        total = self.embed_seconds + self.search_seconds + self.mget_seconds
+        return (
+            f"{self.queries} queries in {total:.3f}s "
+            f"(embed {self.embed_seconds:.3f}s, search {self.search_seconds:.3f}s, "
+            f"mget {self.mget_seconds:.3f}s, "
+            f"{self.parent_refs} parent refs -> {self.unique_parents} keys)"
+        )
+
+
+# 批量检索：与逐条 retriever.invoke 返回相同的结果，但
+# - 所有查询的嵌入只调用一次 embed_documents
+# - 向量搜索：传入 index_manager 时一条 SQL 完成（unnest + LATERAL），
+#   否则用线程池并发调用 similarity_search_by_vector（连接来自向量库的连接池）
+# - MultiVectorRetriever 的父文档在整批查询间去重后只 mget 一次
+# 支持 MultiVectorRetriever 和 vectorstore.as_retriever() 的相似度检索，
+# 其他检索类型（mmr 等）退回 retriever.batch
+class BatchRetriever:
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        index_manager: Optional[PGVectorIndexManager] = None,
+        collection: Optional[str] = None,
+        max_workers: int = 4,
+    ):
+        self.retriever = retriever
+        self.index_manager = index_manager
+        self.collection = collection
+        self.max_workers = max_workers
+        self.last_stats = BatchRetrieveStats()
+
+    def _supported(self) -> bool:
+        if isinstance(self.retriever, MultiVectorRetriever):
+            return self.retriever.search_type == SearchType.similarity
+        if isinstance(self.retriever, VectorStoreRetriever):
+            return self.retriever.search_type == "similarity"
+        return False
+
+    def _search(self, vectors: list[list[float]]) -> list[list[Document]]:
+        search_kwargs = dict(self.retriever.search_kwargs)
+        k = search_kwargs.pop("k", 4)
+        if self.index_manager is not None:
+            # 只支持等值过滤（cmetadata @> filter）
+            results, _ = self.index_manager.batch_search(
+                self.collection, vectors, k, filter=search_kwargs.get("filter")
+            )
+            return [[doc for doc, _ in hits] for hits in results]
+        vectorstore = self.retriever.vectorstore
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(
+                executor.map(
+                    lambda v: vectorstore.similarity_search_by_vector(
+                        v, k, **search_kwargs
+                    ),
+                    vectors,
+                )
+            )
+
+    def batch_retrieve(self, queries: list[str]) -> list[list[Document]]:
+        stats = self.last_stats = BatchRetrieveStats(queries=len(queries))
+        if not queries:
+            return []
+        if not self._supported():
+            return self.retriever.batch(queries)
+
+        start = time.perf_counter()
+        # OllamaEmbeddings 的 embed_query 就是单条的 embed_documents，结果一致
+        vectors = self.retriever.vectorstore.embeddings.embed_documents(queries)
+        embedded = time.perf_counter()
+        sub_docs = self._search(vectors)
+        searched = time.perf_counter()
+        stats.embed_seconds = embedded - start
+        stats.search_seconds = searched - embedded
+        if not isinstance(self.retriever, MultiVectorRetriever):
+            return sub_docs
+
+        # 每个查询内按首次出现顺序去重（与 MultiVectorRetriever 相同），
+        # 再在整批查询间合并成一次 mget
+        id_key = self.retriever.id_key
+        per_query_ids = []
+        for docs in sub_docs:
+            ids = []
+            for doc in docs:
+                if id_key in doc.metadata and doc.metadata[id_key] not in ids:
+                    ids.append(doc.metadata[id_key])
+            per_query_ids.append(ids)
+        unique_ids = list(dict.fromkeys(i for ids in per_query_ids for i in ids))
+        parents = dict(zip(unique_ids, self.retriever.docstore.mget(unique_ids)))
+        stats.mget_seconds = time.perf_counter() - searched
+        stats.parent_refs = sum(len(ids) for ids in per_query_ids)
+        stats.unique_parents = len(unique_ids)
+        return [
+            [parents[i] for i in ids if parents[i] is not None]
+            for ids in per_query_ids
+        ]
+
+
+if __name__ == "__main__":
+    embeddings = CachedEmbeddings(
+        OllamaEmbeddings(base_url="http://localhost:11434", model="nomic-embed-text")
+    )
+    collection_name = "summaries"
+    vectorstore = PGVector(
+        embeddings=embeddings,
+        collection_name=collection_name,
+        connection=connection,
+        use_jsonb=True,
+    )
+    retriever = MultiVectorRetriever(
+        vectorstore=vectorstore, docstore=PooledPostgresDocStore(connection)
+    )
+    queries = [
+        "the death of the prince",
+        "why does the prince love the rose?",
+        "what does the fox say?",
+        "the king who rules over everything",
+    ] * 50
+
+    start = time.perf_counter()
+    sequential = [retriever.invoke(q) for q in queries]
+    print(f"sequential invoke: {time.perf_counter() - start:.3f}s")
+
+    for manager in (None, PGVectorIndexManager(connection)):
+        batch = BatchRetriever(retriever, manager, collection_name)
+        batched = batch.batch_retrieve(queries)
+        same = [[d.page_content for d in docs] for docs in batched] == [
+            [d.page_content for d in docs] for docs in sequential
+        ]
+        mode = "single SQL" if manager else "thread pool"
+        print(f"batch_retrieve ({mode}): {batch.last_stats}, identical={same}")
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import chain
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+
+from ch2_embedding_cache import CachedEmbeddings
+
+
+@dataclass
+class RouteResult:
+    route: Optional[str]
+    score: float
+    scores: dict[str, float]
+
+
+@dataclass
+class RouterMetrics:
+    queries: int = 0
+    batches: int = 0
+    embed_seconds: float = 0.0
+    match_seconds: float = 0.0
+    fallbacks: int = 0
+    # 最近若干批次的单条查询平均延迟（秒）
+    latencies: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        return float(np.percentile(np.fromiter(self.latencies, dtype=float), q))
+
+    def summary(self) -> dict:
+        return {
+            "queries": self.queries,
+            "batches": self.batches,
+            "fallbacks": self.fallbacks,
+            "embed_ms": round(self.embed_seconds * 1000, 2),
+            "match_ms": round(self.match_seconds * 1000, 3),
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+        }
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+# 语义路由器
+# 每个路由可以有多个示例，所有示例的嵌入预先归一化后按路由连续存放成一个矩阵；
+# 一批查询只需一次矩阵乘法即可得到与所有示例的余弦相似度，
+# 路由得分取该路由下相似度最高的 top_k 个示例的平均值，低于 threshold 时回退到 default_route
+class SemanticRouter:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        routes: dict[str, list[str]],
+        threshold: float = 0.0,
+        default_route: Optional[str] = None,
+        top_k: int = 1,
+        dtype=np.float32,
+        matrix: Optional[np.ndarray] = None,
+    ):
+        self.embeddings = embeddings
+        self.routes = routes
+        self.names = list(routes)
+        self.threshold = threshold
+        self.default_route = default_route
+        self.top_k = top_k
+        self.dtype = dtype
+        self.metrics = RouterMetrics()
+
+        # 每个路由在矩阵中占据的列区间 [start, end)
+        self.bounds = []
+        start = 0
+        for name in self.names:
+            self.bounds.append((start, start + len(routes[name])))
+            start += len(routes[name])
+
+        if matrix is None:
+            examples = [text for name in self.names for text in routes[name]]
+            matrix = _normalize(np.asarray(embeddings.embed_documents(examples)))
+        # 可以用 float16 存储，磁盘上的快照减半；内存中另外保留一份 float32 副本，
+        # 计算时在 BLAS 中使用（float16 的矩阵乘法没有 BLAS 实现，慢得多）
+        self.matrix = np.ascontiguousarray(matrix, dtype=dtype)
+        self._compute_matrix = self.matrix.astype(np.float32, copy=False)
+
+    def fingerprint(self) -> str:
+        model = getattr(self.embeddings, "model", type(self.embeddings).__name__)
+        payload = json.dumps([model, self.routes], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def save(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, matrix=self.matrix, fingerprint=self.fingerprint())
+
+    @classmethod
+    def load_or_build(
+        cls, path: str, embeddings: Embeddings, routes: dict[str, list[str]], **kwargs
+    ) -> "SemanticRouter":
+        # 路由示例和嵌入模型都没有变化时直接从磁盘加载矩阵，启动时不再调用嵌入模型
+        router = None
+        if Path(path).exists():
+            data = np.load(path)
+            candidate = cls(embeddings, routes, matrix=data["matrix"], **kwargs)
+            if str(data["fingerprint"]) == candidate.fingerprint():
+                router = candidate
+        if router is None:
+            router = cls(embeddings, routes, **kwargs)
+            router.save(path)
+        return router
+
+    def score_batch(self, query_vectors: np.ndarray) -> np.ndarray:
+        # 返回 (查询数, 路由数) 的得分矩阵
+        sims = _normalize(query_vectors.astype(np.float32)) @ self._compute_matrix.T
+        scores = np.empty((len(sims), len(self.names)), dtype=np.float32)
+        for r, (start, end) in enumerate(self.bounds):
+            part = sims[:, start:end]
+            k = min(self.top_k, end - start)
+            if k == 1:
+                scores[:, r] = part.max(axis=1)
+            else:
+                scores[:, r] = np.partition(part, -k, axis=1)[:, -k:].mean(axis=1)
+        return scores
+
+    def route_batch(self, queries: list[str]) -> list[RouteResult]:
+        if not queries:
+            return []
+        start = time.perf_counter()
+        # 一批查询只调用一次嵌入服务
+        vectors = np.asarray(self.embeddings.embed_documents(queries))
+        embedded = time.perf_counter()
+        scores = self.score_batch(vectors)
+        best = scores.argmax(axis=1)
+        matched = time.perf_counter()
+
+        results = []
+        for i, r in enumerate(best):
+            score = float(scores[i, r])
+            route = self.names[r]
+            if score < self.threshold:
+                route = self.default_route
+                self.metrics.fallbacks += 1
+            results.append(
+                RouteResult(
+                    route=route,
+                    score=score,
+                    scores=dict(zip(self.names, scores[i].tolist())),
+                )
+            )
+
+        self.metrics.queries += len(queries)
+        self.metrics.batches += 1
+        self.metrics.embed_seconds += embedded - start
+        self.metrics.match_seconds += matched - embedded
+        self.metrics.latencies.append((matched - start) / len(queries))
+        return results
+
+    def route(self, query: str) -> RouteResult:
+        return self.route_batch([query])[0]
+
+
+physics_template = """You are a very smart physics professor. You are great at answering questions about physics in a concise and easy-to-understand manner. When you don't know the answer to a question, you admit that you don't know.
+
+Here is a question:
+{query}"""
+
+math_template = """You are a very good mathematician. You are great at answering math questions. You are so good because you are able to break down hard problems into their component parts, answer the component parts, and then put them together to answer the broader question.
+
+Here is a question:
+{query}"""
+
+templates = {"physics": physics_template, "math": math_template}
+
+# 每个路由除了模板本身，再加几个典型问题作为示例
+routes = {
+    "physics": [
+        physics_template,
+        "What is a black hole?",
+        "Explain Newton's third law of motion.",
+        "How fast does light travel?",
+    ],
+    "math": [
+        math_template,
+        "What is the derivative of x squared?",
+        "Prove that the square root of 2 is irrational.",
+        "How do I solve a quadratic equation?",
+    ],
+}
+
+
+if __name__ == "__main__":
+    embeddings = CachedEmbeddings(
+        OllamaEmbeddings(base_url="http://localhost:11434", model="nomic-embed-text")
+    )
+    router = SemanticRouter.load_or_build(
+        "./.cache/semantic_router.npz",
+        embeddings,
+        routes,
+        threshold=0.3,
+        default_route="physics",
+        top_k=2,
+        dtype=np.float16,
+    )
+
+    questions = [
+        "What's a black hole",
+        "What's the velocity of light?",
+        "Why's Newton's third law of motion?",
+        "What is the integral of sin(x)?",
+    ]
+    for question, result in zip(questions, router.route_batch(questions)):
+        print(f"{result.route:<8} {result.score:.3f} {question}")
+    print(router.metrics.summary())
+
+    @chain
+    def prompt_router(query):
+        return PromptTemplate.from_template(templates[router.route(query).route])
+
+    llm = ChatOllama(
+        base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0
+    )
+    semantic_router = prompt_router | llm | StrOutputParser()
+    print(semantic_router.invoke("What's a black hole"))
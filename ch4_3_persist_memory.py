@@ -1,16 +1,32 @@
+import asyncio
+import sys
+from functools import lru_cache
 from typing import Annotated, TypedDict
 
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
 
 # 替换 OpenAI 为 Ollama
 from langchain_ollama import ChatOllama
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph, add_messages
 
+from ch2_pg_docstore import connection
+from ch4_history_window import HistoryWindow
+from ch4_pg_checkpointer import AsyncPooledPostgresSaver
+from ch4_sqlite_checkpointer import SqliteDeltaSaver
+from ch4_summary_memory import SummaryMemory
+from ch4_token_counter import QwenTokenCounter
+
 
 # 定义状态类型，messages 字段将通过 add_messages 注解进行合并
-class State(TypedDict):
+# window_* 字段记录增量历史窗口的位置和 token 数，summary 是滚动摘要，都随检查点一起保存
+class State(TypedDict, total=False):
     messages: Annotated[list, add_messages]
+    window_start: int
+    window_end: int
+    window_tokens: int
+    summary: str
 
 
 # 创建状态图构建器
@@ -23,21 +39,74 @@ model = ChatOllama(
 )
 
 
+# 分词器在第一次处理消息时才加载，导入本模块不需要访问 Hugging Face
+@lru_cache(maxsize=1)
+def get_token_counter() -> QwenTokenCounter:
+    return QwenTokenCounter()
+
+
+# 只把最近 2000 个 token 以内的历史发给模型，每轮只计数新追加的消息
+@lru_cache(maxsize=1)
+def get_history_window() -> HistoryWindow:
+    return HistoryWindow(max_tokens=2000, token_counter=get_token_counter())
+
+
 # 定义聊天机器人节点函数，处理消息并返回回复
 def chatbot(state: State):
-    answer = model.invoke(state["messages"])
-    return {"messages": [answer]}
+    window, update = get_history_window().apply(state)
+    answer = model.invoke(window)
+    return {"messages": [answer], **update}
+
+
+# 滚动摘要模式（--summary）：超过 2000 个 token 后，最早的几轮在后台摘要，
+# 摘要保存在检查点中，旧消息被删除，线程的长度不再无限增长
+@lru_cache(maxsize=1)
+def get_summary_memory() -> SummaryMemory:
+    return SummaryMemory(
+        model, max_tokens=2000, keep_tokens=1000, token_counter=get_token_counter()
+    )
+
+
+def summary_chatbot(state: State, config: RunnableConfig):
+    prompt, update = get_summary_memory().apply(state, config)
+    answer = model.invoke(prompt)
+    return {**update, "messages": update["messages"] + [answer]}
 
 
 if __name__ == "__main__":
 
     # 添加节点和边缘，构建图
-    builder.add_node("chatbot", chatbot)
+    builder.add_node("chatbot", summary_chatbot if "--summary" in sys.argv else chatbot)
     builder.add_edge(START, "chatbot")
     builder.add_edge("chatbot", END)
 
-    # 添加持久化功能，使用 MemorySaver 保存对话状态
-    graph = builder.compile(checkpointer=MemorySaver())
+    if "--postgres" in sys.argv:
+        # 多个 worker 进程共用 Postgres 中的线程，任何进程都可以继续同一个 thread_id；
+        # 这个检查点是异步的，使用 ainvoke/aget_state
+        async def main():
+            saver = AsyncPooledPostgresSaver(connection)
+            graph = builder.compile(checkpointer=saver)
+            thread = {"configurable": {"thread_id": "1"}}
+            for question in ("hi, my name is Jack!", "what is my name?"):
+                result = await graph.ainvoke(
+                    input={"messages": [HumanMessage(question)]}, config=thread
+                )
+                print(result)
+                print()
+            print(await graph.aget_state(thread))
+            await saver.aclose()
+
+        asyncio.run(main())
+        sys.exit()
+
+    # 添加持久化功能，使用 MemorySaver 保存对话状态；
+    # --sqlite 时保存到 SQLite 文件，进程重启后可以继续之前的线程
+    checkpointer = (
+        SqliteDeltaSaver("./.cache/ch4_3_checkpoints.sqlite", keep_last=100)
+        if "--sqlite" in sys.argv
+        else MemorySaver()
+    )
+    graph = builder.compile(checkpointer=checkpointer)
 
     # 配置会话线程，可以支持多个不同的对话
     thread1 = {"configurable": {"thread_id": "1"}}
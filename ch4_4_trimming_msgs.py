@@ -2,7 +2,8 @@ import os
 
 from langchain_core.messages import trim_messages  # 用于裁剪消息历史的工具函数
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from langchain_ollama import ChatOllama
+
+from ch4_token_counter import QwenTokenCounter
 
 if __name__ == "__main__":
     os.environ["HTTP_PROXY"] = "http://localhost:10086"
@@ -13,9 +14,9 @@ if __name__ == "__main__":
     trimmer = trim_messages(
         max_tokens=60,  # 设置最大token数量为60
         strategy="last",  # 使用"最后"策略，保留最近的消息
-        token_counter=ChatOllama(  # 使用ChatOllama作为token计数器
-            model="qwen2.5:32b", base_url="http://localhost:11434"
-        ),
+        # 使用本地 qwen2.5 分词器离线计数，每条消息的 token 数会被缓存；
+        # 原来传入 ChatOllama 时每次计数都要走模型的 get_num_tokens_from_messages
+        token_counter=QwenTokenCounter(),
         include_system=True,  # 包含系统消息
         allow_partial=False,  # 不允许部分消息（即消息要么完整保留，要么完全删除）
         start_on="human",  # 从人类消息开始，确保每轮对话的完整性
@@ -0,0 +1,117 @@
+import time
+from typing import Annotated, Optional, TypedDict
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    trim_messages,
+)
+from langgraph.graph import add_messages
+
+from ch4_token_counter import QwenTokenCounter
+
+
+# 需要增量窗口的图在状态里加上这三个字段，它们随检查点一起保存
+class WindowState(TypedDict, total=False):
+    messages: Annotated[list, add_messages]
+    # 窗口是 messages[window_start:window_end]，window_tokens 是其中的 token 总数；
+    # window_end 之后的消息是上一轮之后新追加的，还没有计入
+    window_start: int
+    window_end: int
+    window_tokens: int
+
+
+# 增量历史窗口，结果与 trim_messages(strategy="last", start_on="human",
+# include_system=..., allow_partial=False) 相同，但每轮只计数新追加的消息，
+# 超出预算时从窗口前端逐条丢弃；窗口起点只会向后移动，所以每轮的开销与历史长度无关
+# （历史必须是只追加的；如果消息被删除或替换，会从头重新计算一次）
+class HistoryWindow:
+    def __init__(
+        self,
+        max_tokens: int,
+        token_counter: Optional[QwenTokenCounter] = None,
+        start_on: Optional[str] = "human",
+        include_system: bool = True,
+    ):
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or QwenTokenCounter()
+        self.start_on = start_on
+        self.include_system = include_system
+
+    def apply(self, state: WindowState) -> tuple[list[BaseMessage], dict]:
+        # 返回 (发给模型的消息, 需要写回状态的窗口字段)
+        messages = state["messages"]
+        count = self.token_counter.count_message
+        system = None
+        if self.include_system and messages and isinstance(messages[0], SystemMessage):
+            system = messages[0]
+        first = 1 if system is not None else 0
+
+        start = state.get("window_start", first)
+        end = state.get("window_end", first)
+        total = state.get("window_tokens", 0)
+        if end > len(messages) or start < first:
+            start, end, total = first, first, 0
+
+        for message in messages[end:]:
+            total += count(message)
+        end = len(messages)
+
+        budget = self.max_tokens - (count(system) if system is not None else 0)
+        while start < end and total > budget:
+            total -= count(messages[start])
+            start += 1
+        if self.start_on is not None:
+            while start < end and messages[start].type != self.start_on:
+                total -= count(messages[start])
+                start += 1
+
+        window = ([system] if system is not None else []) + messages[start:end]
+        update = {"window_start": start, "window_end": end, "window_tokens": total}
+        return window, update
+
+
+if __name__ == "__main__":
+    counter = QwenTokenCounter()
+    max_tokens = 2000
+    window = HistoryWindow(max_tokens, counter)
+    trimmer = trim_messages(
+        max_tokens=max_tokens,
+        strategy="last",
+        token_counter=counter,
+        include_system=True,
+        allow_partial=False,
+        start_on="human",
+    )
+
+    # 模拟长对话：每轮一问一答，比较每轮准备模型输入的耗时
+    messages: list[BaseMessage] = [SystemMessage("you're a good assistant")]
+    state: WindowState = {"messages": messages}
+    turn_cost = {"window": 0.0, "trim_messages": 0.0}
+    last_report = 0
+    for turn in range(1, 2001):
+        messages.append(HumanMessage(f"question {turn}: what happened on day {turn}?"))
+        start = time.perf_counter()
+        selected, update = window.apply(state)
+        turn_cost["window"] += time.perf_counter() - start
+        state.update(update)
+        start = time.perf_counter()
+        expected = trimmer.invoke(messages)
+        turn_cost["trim_messages"] += time.perf_counter() - start
+        assert selected == expected
+        messages.append(AIMessage(f"On day {turn} the little prince met a friend."))
+        if turn in (5, 50, 500, 2000):
+            # 两次输出之间各轮的平均耗时
+            turns = turn - last_report
+            costs = ", ".join(
+                f"{name} {cost * 1000 / turns:.3f}ms/turn"
+                for name, cost in turn_cost.items()
+            )
+            print(
+                f"{len(messages):>5} messages: {costs} "
+                f"(window: {len(selected)} msgs, {update['window_tokens']} tokens)"
+            )
+            turn_cost = dict.fromkeys(turn_cost, 0.0)
+            last_report = turn
@@ -0,0 +1,578 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+
+from ch2_pg_docstore import connection, to_conninfo
+
+# 表名加上 chat_ 前缀，避免与 langgraph-checkpoint-postgres 的表冲突
+SCHEMA_SQL = [
+    # 主键 (thread_id, checkpoint_ns, checkpoint_id) 就是获取状态时用的索引：
+    # checkpoint_ns 总是等值条件，按 checkpoint_id 倒序取第一条即最新的检查点
+    """
+    CREATE TABLE IF NOT EXISTS chat_checkpoints (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        checkpoint_id TEXT NOT NULL,
+        parent_checkpoint_id TEXT,
+        checkpoint JSONB NOT NULL,
+        metadata JSONB NOT NULL DEFAULT '{}',
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_checkpoint_blobs (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        channel TEXT NOT NULL,
+        version TEXT NOT NULL,
+        type TEXT NOT NULL,
+        blob BYTEA,
+        PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_checkpoint_writes (
+        thread_id TEXT NOT NULL,
+        checkpoint_ns TEXT NOT NULL DEFAULT '',
+        checkpoint_id TEXT NOT NULL,
+        task_id TEXT NOT NULL,
+        task_path TEXT NOT NULL DEFAULT '',
+        idx INTEGER NOT NULL,
+        channel TEXT NOT NULL,
+        type TEXT NOT NULL,
+        blob BYTEA,
+        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+    )
+    """,
+]
+
+# 检查点、各通道的值和未完成的写入在一次查询中取回
+SELECT_SQL = """
+SELECT c.thread_id, c.checkpoint_ns, c.checkpoint_id, c.parent_checkpoint_id,
+    c.checkpoint, c.metadata,
+    (
+        SELECT array_agg(array[convert_to(b.channel, 'UTF8'),
+            convert_to(b.type, 'UTF8'), b.blob])
+        FROM jsonb_each_text(c.checkpoint -> 'channel_versions') v
+        JOIN chat_checkpoint_blobs b
+            ON b.thread_id = c.thread_id AND b.checkpoint_ns = c.checkpoint_ns
+            AND b.channel = v.key AND b.version = v.value
+    ) AS channel_values,
+    (
+        SELECT array_agg(array[convert_to(w.task_path, 'UTF8'),
+            convert_to(w.task_id, 'UTF8'), convert_to(w.idx::text, 'UTF8'),
+            convert_to(w.channel, 'UTF8'), convert_to(w.type, 'UTF8'), w.blob])
+        FROM chat_checkpoint_writes w
+        WHERE w.thread_id = c.thread_id AND w.checkpoint_ns = c.checkpoint_ns
+            AND w.checkpoint_id = c.checkpoint_id
+    ) AS pending_writes
+FROM chat_checkpoints c
+"""
+UPSERT_BLOB_SQL = """
+INSERT INTO chat_checkpoint_blobs
+    (thread_id, checkpoint_ns, channel, version, type, blob)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (thread_id, checkpoint_ns, channel, version) DO NOTHING
+"""
+UPSERT_CHECKPOINT_SQL = """
+INSERT INTO chat_checkpoints (thread_id, checkpoint_ns, checkpoint_id,
+    parent_checkpoint_id, checkpoint, metadata)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id)
+DO UPDATE SET checkpoint = EXCLUDED.checkpoint, metadata = EXCLUDED.metadata
+"""
+INSERT_WRITE_SQL = """
+INSERT INTO chat_checkpoint_writes (thread_id, checkpoint_ns, checkpoint_id,
+    task_id, task_path, idx, channel, type, blob)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+"""
+INSERT_WRITE_IGNORE_SQL = INSERT_WRITE_SQL + "DO NOTHING"
+INSERT_WRITE_REPLACE_SQL = (
+    INSERT_WRITE_SQL
+    + "DO UPDATE SET channel = EXCLUDED.channel, type = EXCLUDED.type, "
+    "blob = EXCLUDED.blob"
+)
+DELETE_THREAD_SQL = [
+    f"DELETE FROM {table} WHERE thread_id = %s"
+    for table in ("chat_checkpoints", "chat_checkpoint_blobs", "chat_checkpoint_writes")
+]
+
+
+def _dumps(obj: Any) -> str:
+    # JSONB 不接受 \u0000
+    return json.dumps(obj, default=str).replace("\\u0000", "")
+
+
+# 基于 psycopg 异步连接池的检查点，多个 worker 进程共用同一个数据库，
+# 任何进程都可以继续任何线程
+# - 读取：检查点、通道值和未完成的写入在一次按主键索引的查询中取回
+# - 写入：put 和 put_writes 不直接执行，而是进入队列；后台的提交任务每次取出队列中
+#   所有的操作，在一个事务中用 pipeline 批量执行（组提交）。并发的多个线程/多个任务
+#   的检查点和写入共用一次往返和一次提交，调用方仍然等到提交完成才返回
+# 同步方法只能在其他线程中调用（例如 graph.get_state），它们把协程交给事件循环执行
+class AsyncPooledPostgresSaver(BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        connection_string: str = connection,
+        min_size: int = 2,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_batch: int = 1000,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.max_batch = max_batch
+        # 连接池必须在事件循环中打开，这里只创建，首次使用时再打开并建表
+        self.pool = AsyncConnectionPool(
+            to_conninfo(connection_string),
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            open=False,
+        )
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._opened = False
+        self._open_lock: Optional[asyncio.Lock] = None
+        # (一次 put/put_writes 的全部语句和参数, future)，同一次调用的语句总在同一个事务中
+        self._queue: list[tuple[list[tuple[str, list]], asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.transactions = 0
+        self.operations = 0
+        self.rows = 0
+
+    async def setup(self) -> AsyncConnectionPool:
+        if self._opened:
+            return self.pool
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if not self._opened:
+                self.loop = asyncio.get_running_loop()
+                await self.pool.open()
+                async with self.pool.connection() as conn:
+                    for sql in SCHEMA_SQL:
+                        await conn.execute(sql)
+                self._opened = True
+        return self.pool
+
+    async def _submit(self, ops: list[tuple[str, list]]) -> None:
+        # 把一组操作放进队列，等它们所在的事务提交
+        await self.setup()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((ops, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+        await future
+
+    async def _flush(self) -> None:
+        while self._queue:
+            batch = self._queue[: self.max_batch]
+            del self._queue[: self.max_batch]
+            try:
+                await self._commit(batch)
+                errors = [None] * len(batch)
+            except Exception as e:
+                errors = [e]
+                if len(batch) > 1:
+                    # 整个事务已回滚：逐个调用单独提交，只有出错的调用方收到异常
+                    errors = [await self._commit_one(item) for item in batch]
+            for (_, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def _commit_one(self, item) -> Optional[Exception]:
+        try:
+            await self._commit([item])
+        except Exception as e:
+            return e
+        return None
+
+    async def _commit(self, batch) -> None:
+        async with self.pool.connection() as conn:
+            async with conn.transaction(), conn.pipeline():
+                async with conn.cursor() as cur:
+                    rows = await self._execute_batch(cur, batch)
+        self.transactions += 1
+        self.operations += len(batch)
+        self.rows += rows
+
+    async def _execute_batch(self, cur, batch) -> int:
+        # 同一条语句的参数合并成一次 executemany；事务整体提交，语句之间的先后顺序
+        # 对读者不可见。删除线程的语句之前的操作先执行，保证删除在它们之后生效
+        groups: dict[str, list] = {}
+        statements = [op for ops, _ in batch for op in ops]
+        count = 0
+        for sql, params in statements + [(None, [])]:
+            if sql is None or sql in DELETE_THREAD_SQL:
+                for grouped_sql, rows in groups.items():
+                    await cur.executemany(grouped_sql, rows)
+                    count += len(rows)
+                groups.clear()
+                if sql is not None:
+                    await cur.execute(sql, params[0])
+                    count += 1
+                continue
+            groups.setdefault(sql, []).extend(params)
+        return count
+
+    def _to_tuple(self, row) -> CheckpointTuple:
+        (
+            thread_id,
+            ns,
+            checkpoint_id,
+            parent_id,
+            checkpoint,
+            metadata,
+            channel_values,
+            pending_writes,
+        ) = row
+        values = {}
+        for channel, type_, blob in channel_values or []:
+            if type_ == b"empty":
+                continue
+            values[channel.decode()] = self.serde.loads_typed((type_.decode(), blob))
+        writes = []
+        for task_path, task_id, idx, channel, type_, blob in pending_writes or []:
+            key = writes_sort_key(task_path.decode(), task_id.decode(), int(idx))
+            writes.append((key, channel.decode(), type_.decode(), blob))
+        writes.sort(key=lambda w: w[0])
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=metadata,
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (key[1], channel, self.serde.loads_typed((type_, blob)))
+                for key, channel, type_, blob in writes
+            ],
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        if checkpoint_id := get_checkpoint_id(config):
+            sql = SELECT_SQL + (
+                "WHERE c.thread_id = %s AND c.checkpoint_ns = %s "
+                "AND c.checkpoint_id = %s"
+            )
+            params: tuple = (thread_id, ns, checkpoint_id)
+        else:
+            sql = SELECT_SQL + (
+                "WHERE c.thread_id = %s AND c.checkpoint_ns = %s "
+                "ORDER BY c.checkpoint_id DESC LIMIT 1"
+            )
+            params = (thread_id, ns)
+        pool = await self.setup()
+        async with pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            row = await cur.fetchone()
+        return self._to_tuple(row) if row else None
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        where, params = [], []
+        if config:
+            where.append("c.thread_id = %s")
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("c.checkpoint_ns = %s")
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("c.checkpoint_id = %s")
+                params.append(checkpoint_id)
+        if filter:
+            where.append("c.metadata @> %s")
+            params.append(Jsonb(filter, dumps=_dumps))
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("c.checkpoint_id < %s")
+            params.append(before_id)
+        sql = SELECT_SQL
+        if where:
+            sql += "WHERE " + " AND ".join(where)
+        sql += " ORDER BY c.checkpoint_id DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        pool = await self.setup()
+        async with pool.connection() as conn:
+            cur = await conn.execute(sql, params)
+            rows = await cur.fetchall()
+        for row in rows:
+            yield self._to_tuple(row)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, blob = (
+                self.serde.dumps_typed(values[channel])
+                if channel in values
+                else ("empty", None)
+            )
+            blobs.append((thread_id, ns, channel, str(version), type_, blob))
+        row = (
+            thread_id,
+            ns,
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            Jsonb(c, dumps=_dumps),
+            Jsonb(get_checkpoint_metadata(config, metadata), dumps=_dumps),
+        )
+        # 通道值在检查点之前写入，读到检查点时它引用的值一定已经存在
+        ops = [(UPSERT_BLOB_SQL, blobs)] if blobs else []
+        await self._submit(ops + [(UPSERT_CHECKPOINT_SQL, [row])])
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if not writes:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # 特殊通道（错误、中断等）的写入覆盖旧值，普通写入重复时保留第一次的
+        sql = (
+            INSERT_WRITE_REPLACE_SQL
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else INSERT_WRITE_IGNORE_SQL
+        )
+        rows = [
+            (
+                thread_id,
+                ns,
+                checkpoint_id,
+                task_id,
+                task_path,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        await self._submit([(sql, rows)])
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self._submit([(sql, [(thread_id,)]) for sql in DELETE_THREAD_SQL])
+
+    def _run(self, coro):
+        # 同步接口：在其他线程中把协程交给检查点所在的事件循环；
+        # 在事件循环所在的线程中同步等待会死锁
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self.loop is None or running is self.loop:
+            coro.close()
+            raise RuntimeError(
+                "synchronous methods can only be called from another thread while "
+                "the saver's event loop is running; use graph.ainvoke/aget_state"
+            )
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._run(self.aget_tuple(config))
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        async def collect():
+            return [
+                item
+                async for item in self.alist(
+                    config, filter=filter, before=before, limit=limit
+                )
+            ]
+
+        yield from self._run(collect())
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self._run(self.aput(config, checkpoint, metadata, new_versions))
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self._run(self.aput_writes(config, writes, task_id, task_path))
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._run(self.adelete_thread(thread_id))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # 与 MemorySaver 相同：可以按字符串排序的递增版本号
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def stats(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "operations": self.operations,
+            "rows": self.rows,
+            "ops_per_transaction": round(self.operations / self.transactions, 2)
+            if self.transactions
+            else 0.0,
+        }
+
+    async def aclose(self) -> None:
+        if self._flusher is not None:
+            await self._flusher
+        if self._opened:
+            await self.pool.close()
+            self._opened = False
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p95 = samples[int(len(samples) * 0.95)] * 1000
+    return f"p50 {p50:.2f}ms, p95 {p95:.2f}ms"
+
+
+async def benchmark(saver: AsyncPooledPostgresSaver, threads: int, turns: int):
+    # 用与 ch4_3_persist_memory.py 相同的单节点图，模拟一个 worker 同时服务多个线程
+    from langgraph.graph import END, START, StateGraph
+
+    from ch4_3_persist_memory import State
+
+    def chatbot(state: State):
+        turn = len(state["messages"]) // 2
+        answer = AIMessage(f"On day {turn} the little prince met a friend.")
+        return {"messages": [answer]}
+
+    builder = StateGraph(State)
+    builder.add_node("chatbot", chatbot)
+    builder.add_edge(START, "chatbot")
+    builder.add_edge("chatbot", END)
+    graph = builder.compile(checkpointer=saver)
+    configs = [
+        {"configurable": {"thread_id": f"bench-{i}"}} for i in range(threads)
+    ]
+
+    async def conversation(config):
+        for turn in range(turns):
+            await graph.ainvoke(
+                {"messages": [HumanMessage(f"question {turn}: what happened?")]},
+                config,
+            )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(config) for config in configs))
+    print(
+        f"{threads} threads x {turns} turns in {time.perf_counter() - start:.2f}s, "
+        f"{saver.stats()}"
+    )
+
+    get_seconds = []
+    for config in random.sample(configs, min(threads, 200)):
+        start = time.perf_counter()
+        state = await graph.aget_state(config)
+        get_seconds.append(time.perf_counter() - start)
+        assert len(state.values["messages"]) == 2 * turns
+    print(f"aget_state: {_percentiles(get_seconds)}")
+
+    # 同步的 graph.get_state 在其他线程中调用
+    state = await asyncio.to_thread(graph.get_state, configs[0])
+    print(f"get_state from a worker thread: {len(state.values['messages'])} messages")
+
+    for config in configs:
+        await saver.adelete_thread(config["configurable"]["thread_id"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Postgres 检查点的并发基准")
+    parser.add_argument("--connection", default=connection)
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    # --max-batch 1 时每次 put/put_writes 单独一个事务，用作对照
+    parser.add_argument("--max-batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    async def main():
+        saver = AsyncPooledPostgresSaver(args.connection, max_batch=args.max_batch)
+        await benchmark(saver, args.threads, args.turns)
+        await saver.aclose()
+
+    asyncio.run(main())
@@ -0,0 +1,654 @@
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+DEFAULT_PATH = "./.cache/checkpoints.sqlite"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    compressed INTEGER NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+-- kind: 0 完整快照，1 增量（只保存相对 base_version 追加的列表元素）
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    base_version TEXT,
+    depth INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    compressed INTEGER NOT NULL,
+    data BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    compressed INTEGER NOT NULL,
+    value BLOB,
+    task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+# 从请求的版本出发沿 base_version 找到最近的完整快照，一次查询取回整条链
+LOAD_BLOBS_SQL = """
+WITH RECURSIVE wanted(channel, version) AS (VALUES {values}),
+chain(channel, version, kind, base_version, depth, type, compressed, data) AS (
+    SELECT b.channel, b.version, b.kind, b.base_version, b.depth, b.type,
+        b.compressed, b.data
+    FROM wanted w JOIN blobs b
+        ON b.thread_id = ? AND b.checkpoint_ns = ?
+        AND b.channel = w.channel AND b.version = w.version
+    UNION ALL
+    SELECT b.channel, b.version, b.kind, b.base_version, b.depth, b.type,
+        b.compressed, b.data
+    FROM chain c JOIN blobs b
+        ON b.thread_id = ? AND b.checkpoint_ns = ?
+        AND b.channel = c.channel AND b.version = c.base_version
+)
+SELECT channel, version, kind, depth, type, compressed, data
+FROM chain ORDER BY channel, depth
+"""
+SELECT_CHECKPOINT_SQL = (
+    "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, "
+    "compressed, checkpoint, metadata FROM checkpoints"
+)
+INSERT_CHECKPOINT_SQL = (
+    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_BLOB_SQL = "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SELECT_WRITES_SQL = (
+    "SELECT task_id, idx, channel, type, compressed, value, task_path FROM writes "
+    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+)
+
+
+@dataclass
+class _LastValue:
+    # 某个线程的某个列表通道最近写入（或读出）的版本，用来判断下次能否只存增量
+    version: str
+    value: list
+    depth: int
+
+
+@dataclass
+class SaverStats:
+    puts: int = 0
+    full_blobs: int = 0
+    delta_blobs: int = 0
+    bytes_written: int = 0
+    pruned_checkpoints: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "puts": self.puts,
+            "full_blobs": self.full_blobs,
+            "delta_blobs": self.delta_blobs,
+            "bytes_written": self.bytes_written,
+            "pruned_checkpoints": self.pruned_checkpoints,
+        }
+
+
+# 基于 SQLite（WAL 模式）的持久化检查点，进程重启后线程不会丢失
+# - MemorySaver 每一步都把完整的 messages 列表再存一份，存储量随对话长度平方增长；
+#   这里列表通道只存相对上一个版本追加的元素，每 snapshot_every 个版本存一次完整快照，
+#   读取时沿增量链找到最近的快照再依次拼接，链长不超过 snapshot_every
+# - 值用检查点自带的 serde（msgpack）序列化，超过 compress_min 字节再用 zlib 压缩
+# - keep_last 设置后，每个线程只保留最近 keep_last 个检查点，
+#   不再被引用的增量和快照一并删除
+# 一个 put 是一个事务；多个进程可以共用同一个数据库文件
+class SqliteDeltaSaver(BaseCheckpointSaver[str]):
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        snapshot_every: int = 32,
+        keep_last: Optional[int] = None,
+        compress_min: int = 256,
+        max_cached: int = 10_000,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be at least 1")
+        self.path = path
+        self.snapshot_every = max(1, snapshot_every)
+        self.keep_last = keep_last
+        self.compress_min = compress_min
+        self.max_cached = max_cached
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA_SQL)
+        self._lock = threading.RLock()
+        self._last: OrderedDict[tuple[str, str, str], _LastValue] = OrderedDict()
+        self.stats = SaverStats()
+
+    def _encode(self, value: Any) -> tuple[str, int, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= self.compress_min:
+            packed = zlib.compress(data, 1)
+            if len(packed) < len(data):
+                return type_, 1, packed
+        return type_, 0, data
+
+    def _decode(self, type_: str, compressed: int, data: Optional[bytes]) -> Any:
+        if compressed:
+            data = zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    def _remember(self, key: tuple[str, str, str], last: Optional[_LastValue]):
+        if last is None:
+            self._last.pop(key, None)
+            return
+        self._last[key] = last
+        self._last.move_to_end(key)
+        while len(self._last) > self.max_cached:
+            self._last.popitem(last=False)
+
+    def _blob_row(self, thread_id: str, ns: str, channel: str, version, values):
+        key = (thread_id, ns, channel)
+        version = str(version)
+        if channel not in values:
+            self._remember(key, None)
+            return (thread_id, ns, channel, version, 0, None, 0, "empty", 0, None)
+        value = values[channel]
+        last = self._last.get(key)
+        # 新列表以上一个版本为前缀时只存追加的部分；消息对象通常就是同一个，
+        # 先比较 is，再用 == 兜底（例如按 id 替换了某条消息时就不再是前缀）
+        if (
+            isinstance(value, list)
+            and last is not None
+            and last.depth + 1 < self.snapshot_every
+            and len(last.value) <= len(value)
+            and all(a is b or a == b for a, b in zip(last.value, value))
+        ):
+            type_, compressed, data = self._encode(value[len(last.value) :])
+            row = (thread_id, ns, channel, version, 1, last.version, last.depth + 1)
+            self.stats.delta_blobs += 1
+        else:
+            type_, compressed, data = self._encode(value)
+            row = (thread_id, ns, channel, version, 0, None, 0)
+            self.stats.full_blobs += 1
+        self.stats.bytes_written += len(data)
+        if isinstance(value, list):
+            self._remember(key, _LastValue(version, list(value), row[6]))
+        else:
+            self._remember(key, None)
+        return row + (type_, compressed, data)
+
+    def _load_blobs(
+        self, thread_id: str, ns: str, versions: ChannelVersions
+    ) -> dict[str, Any]:
+        if not versions:
+            return {}
+        pairs = list(versions.items())
+        sql = LOAD_BLOBS_SQL.format(values=", ".join("(?, ?)" for _ in pairs))
+        params = [str(x) for pair in pairs for x in pair]
+        rows = self.conn.execute(sql, params + [thread_id, ns] * 2).fetchall()
+        # 每个通道的链按 depth 从快照（0）到请求的版本排列
+        chains: dict[str, list] = {}
+        for row in rows:
+            chains.setdefault(row[0], []).append(row)
+        result: dict[str, Any] = {}
+        for channel, chain in chains.items():
+            head = chain[-1]
+            if head[4] == "empty" or chain[0][2] != 0:
+                continue
+            value = self._decode(*chain[0][4:])
+            for row in chain[1:]:
+                value = value + self._decode(*row[4:])
+            result[channel] = value
+            if isinstance(value, list):
+                self._remember(
+                    (thread_id, ns, channel), _LastValue(head[1], list(value), head[3])
+                )
+        return result
+
+    def _load_writes(self, thread_id: str, ns: str, checkpoint_id: str) -> list:
+        rows = self.conn.execute(
+            SELECT_WRITES_SQL, (thread_id, ns, checkpoint_id)
+        ).fetchall()
+        rows.sort(key=lambda r: writes_sort_key(r[6], r[0], r[1]))
+        return [(r[0], r[2], self._decode(r[3], r[4], r[5])) for r in rows]
+
+    def _to_tuple(self, row) -> CheckpointTuple:
+        thread_id, ns, checkpoint_id, parent_id, type_, compressed, data, metadata = row
+        checkpoint = self._decode(type_, compressed, data)
+        checkpoint["channel_values"] = self._load_blobs(
+            thread_id, ns, checkpoint["channel_versions"]
+        )
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed((type_, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=self._load_writes(thread_id, ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    SELECT_CHECKPOINT_SQL
+                    + " WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "AND checkpoint_id = ?",
+                    (thread_id, ns, checkpoint_id),
+                ).fetchone()
+            else:
+                # 主键索引上倒序取第一条，即最新的检查点
+                row = self.conn.execute(
+                    SELECT_CHECKPOINT_SQL
+                    + " WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, ns),
+                ).fetchone()
+            return self._to_tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        sql = SELECT_CHECKPOINT_SQL
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+        # 元数据是序列化后的二进制，filter 只能在取出后比较
+        if limit is not None and not filter:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[4], row[7]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            # 只在构造时持有锁，调用方拿着结果时不阻塞其他线程的读写
+            with self._lock:
+                item = self._to_tuple(row)
+            yield item
+            if limit is not None:
+                limit -= 1
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        with self._lock, self.conn:
+            rows = [
+                self._blob_row(thread_id, ns, channel, version, values)
+                for channel, version in new_versions.items()
+            ]
+            self.conn.executemany(INSERT_BLOB_SQL, rows)
+            # 检查点本身（各通道的版本号等）同样压缩，元数据保持原样
+            type_, compressed, data = self._encode(c)
+            _, meta = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+            self.conn.execute(
+                INSERT_CHECKPOINT_SQL,
+                (
+                    thread_id,
+                    ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    compressed,
+                    data,
+                    meta,
+                ),
+            )
+            self.stats.puts += 1
+            self.stats.bytes_written += len(data) + len(meta)
+            if self.keep_last is not None:
+                self._retain(thread_id, ns, self.keep_last)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # 特殊通道（错误、中断等）的写入覆盖旧值，普通写入重复时保留第一次的
+        verb = (
+            "INSERT OR REPLACE"
+            if all(channel in WRITES_IDX_MAP for channel, _ in writes)
+            else "INSERT OR IGNORE"
+        )
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, compressed, data = self._encode(value)
+            rows.append(
+                (
+                    thread_id,
+                    ns,
+                    checkpoint_id,
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type_,
+                    compressed,
+                    data,
+                    task_path,
+                )
+            )
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def _retain(self, thread_id: str, ns: str, keep: int) -> int:
+        old = [
+            (thread_id, ns, row[0])
+            for row in self.conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? "
+                "AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                (thread_id, ns, keep),
+            )
+        ]
+        if not old:
+            return 0
+        self.conn.executemany(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND checkpoint_id = ?",
+            old,
+        )
+        self.conn.executemany(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND checkpoint_id = ?",
+            old,
+        )
+        # 保留剩余检查点引用的版本，以及它们的增量链一直到快照
+        needed = set()
+        for row in self.conn.execute(
+            "SELECT type, compressed, checkpoint FROM checkpoints WHERE thread_id = ? "
+            "AND checkpoint_ns = ?",
+            (thread_id, ns),
+        ):
+            versions = self._decode(*row)["channel_versions"]
+            needed.update((ch, str(v)) for ch, v in versions.items())
+        bases = {
+            (ch, v): base
+            for ch, v, base in self.conn.execute(
+                "SELECT channel, version, base_version FROM blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, ns),
+            )
+        }
+        kept: set = set()
+        stack = [key for key in needed if key in bases]
+        while stack:
+            key = stack.pop()
+            if key in kept:
+                continue
+            kept.add(key)
+            if bases[key] is not None and (key[0], bases[key]) in bases:
+                stack.append((key[0], bases[key]))
+        self.conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND channel = ? AND version = ?",
+            [(thread_id, ns, ch, v) for ch, v in bases if (ch, v) not in kept],
+        )
+        # 被删除的版本不能再作为增量的基准
+        for key, last in list(self._last.items()):
+            if key[:2] == (thread_id, ns) and (key[2], last.version) not in kept:
+                del self._last[key]
+        self.stats.pruned_checkpoints += len(old)
+        return len(old)
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest"):
+        # keep_latest：每个命名空间只保留最新的检查点；delete：删除整个线程
+        with self._lock, self.conn:
+            for thread_id in thread_ids:
+                if strategy == "delete":
+                    self._delete_thread(thread_id)
+                    continue
+                for (ns,) in self.conn.execute(
+                    "SELECT DISTINCT checkpoint_ns FROM checkpoints "
+                    "WHERE thread_id = ?",
+                    (thread_id,),
+                ).fetchall():
+                    self._retain(thread_id, ns, 1)
+
+    def _delete_thread(self, thread_id: str) -> None:
+        for table in ("checkpoints", "blobs", "writes"):
+            self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        for key in [key for key in self._last if key[0] == thread_id]:
+            del self._last[key]
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self.conn:
+            self._delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # 与 MemorySaver 相同：可以按字符串排序的递增版本号
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def file_size(self) -> int:
+        # 数据库文件加上尚未合并的 WAL 文件
+        return sum(
+            os.path.getsize(p)
+            for p in (self.path, self.path + "-wal")
+            if os.path.exists(p)
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1000
+    p95 = samples[int(len(samples) * 0.95)] * 1000
+    return f"p50 {p50:.3f}ms, p95 {p95:.3f}ms"
+
+
+def benchmark(saver: SqliteDeltaSaver, threads: int, turns: int) -> None:
+    # 用与 ch4_3_persist_memory.py 相同的单节点图生成检查点：每轮一问一答
+    from langgraph.graph import END, START, StateGraph
+
+    from ch4_3_persist_memory import State
+
+    def chatbot(state: State):
+        turn = len(state["messages"]) // 2
+        answer = AIMessage(f"On day {turn} the little prince met a friend.")
+        return {"messages": [answer]}
+
+    builder = StateGraph(State)
+    builder.add_node("chatbot", chatbot)
+    builder.add_edge(START, "chatbot")
+    builder.add_edge("chatbot", END)
+    graph = builder.compile(checkpointer=saver)
+
+    put_seconds: list[float] = []
+    put = saver.put
+
+    def timed_put(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return put(*args, **kwargs)
+        finally:
+            put_seconds.append(time.perf_counter() - start)
+
+    saver.put = timed_put
+    start = time.perf_counter()
+    for turn in range(turns):
+        for t in range(threads):
+            graph.invoke(
+                {"messages": [HumanMessage(f"question {turn}: what happened?")]},
+                {"configurable": {"thread_id": f"thread-{t}"}},
+            )
+    saver.put = put
+    print(
+        f"{threads} threads x {turns} turns in {time.perf_counter() - start:.1f}s, "
+        f"put: {_percentiles(put_seconds)}"
+    )
+
+    get_seconds = []
+    for t in random.sample(range(threads), min(threads, 1000)):
+        config = {"configurable": {"thread_id": f"thread-{t}"}}
+        start = time.perf_counter()
+        state = graph.get_state(config)
+        get_seconds.append(time.perf_counter() - start)
+        assert len(state.values["messages"]) == 2 * turns
+    print(f"get_state: {_percentiles(get_seconds)}")
+    print(f"file size: {saver.file_size() / 1e6:.1f}MB, {saver.stats.as_dict()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite 检查点的 put/get_state 基准")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--threads", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--snapshot-every", type=int, default=32)
+    parser.add_argument("--keep-last", type=int, default=None)
+    args = parser.parse_args()
+
+    # 每次从空库开始，便于比较不同参数下的文件大小
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.path + suffix):
+            os.remove(args.path + suffix)
+    saver = SqliteDeltaSaver(
+        args.path, snapshot_every=args.snapshot_every, keep_last=args.keep_last
+    )
+    benchmark(saver, args.threads, args.turns)
+    saver.close()
@@ -0,0 +1,223 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Annotated, Optional, TypedDict
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+)
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import add_messages
+
+from ch4_token_counter import QwenTokenCounter, message_text
+
+SUMMARY_PROMPT = """Summarize the conversation below so that an assistant can \
+continue it without seeing the original messages. Keep names, facts, preferences \
+and open questions; drop greetings and small talk. Reply with the summary only.
+
+{previous}Conversation:
+{conversation}"""
+
+
+# 需要滚动摘要的图在状态里加上 summary 字段，它随检查点一起保存；
+# 被摘要的旧消息通过 RemoveMessage 从 messages 中删除
+class SummaryState(TypedDict, total=False):
+    messages: Annotated[list, add_messages]
+    summary: str
+
+
+@dataclass
+class SummaryResult:
+    summary: str
+    # 已经被摘要、需要从检查点中删除的消息 id
+    removed_ids: list[str]
+    seconds: float
+
+
+# 滚动摘要记忆
+# - 每轮请求时，如果线程的消息超过 max_tokens，就把最早的若干轮（保留最近
+#   keep_tokens 以内、从 human 消息开始的部分）连同之前的摘要提交到后台线程池生成新摘要；
+#   当前请求不等待，照常使用旧摘要和全部消息
+# - 之后的请求发现摘要已经生成好时，在本轮的状态更新中写入新摘要并删除被摘要的消息，
+#   摘要和消息的变化都由图的节点写回，不会与正在进行的请求冲突
+# - 每个线程同时最多只有一个摘要任务；进程重启时未完成的任务丢失，下一轮会重新提交
+class SummaryMemory:
+    def __init__(
+        self,
+        summarizer: BaseChatModel,
+        max_tokens: int = 2000,
+        keep_tokens: int = 1000,
+        token_counter: Optional[QwenTokenCounter] = None,
+        max_workers: int = 2,
+    ):
+        if keep_tokens >= max_tokens:
+            raise ValueError("keep_tokens must be smaller than max_tokens")
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.keep_tokens = keep_tokens
+        self.token_counter = token_counter or QwenTokenCounter()
+        self._executor = ThreadPoolExecutor(max_workers, "summary-memory")
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.applied = 0
+        self.failed = 0
+        self.summarized_messages = 0
+        self.background_seconds = 0.0
+
+    def _cut(self, messages: list[BaseMessage]) -> int:
+        # 返回需要摘要的消息数：从最早的消息开始丢，直到剩余的不超过 keep_tokens，
+        # 再推进到下一条 human 消息，避免把一轮对话（或工具调用和结果）拆开
+        counts = [self.token_counter.count_message(m) for m in messages]
+        remaining = sum(counts)
+        if remaining <= self.max_tokens:
+            return 0
+        cut = 0
+        while cut < len(messages) and remaining > self.keep_tokens:
+            remaining -= counts[cut]
+            cut += 1
+        while cut < len(messages) and messages[cut].type != "human":
+            cut += 1
+        # 至少保留最后一条 human 消息开始的这一轮
+        if cut >= len(messages):
+            last_human = [i for i, m in enumerate(messages) if m.type == "human"]
+            cut = last_human[-1] if last_human else 0
+        return cut
+
+    def _summarize(self, summary: str, messages: list[BaseMessage]) -> SummaryResult:
+        start = time.perf_counter()
+        conversation = "\n".join(f"{m.type}: {message_text(m)}" for m in messages)
+        previous = f"Existing summary:\n{summary}\n\n" if summary else ""
+        prompt = SUMMARY_PROMPT.format(previous=previous, conversation=conversation)
+        response = self.summarizer.invoke([HumanMessage(prompt)])
+        return SummaryResult(
+            summary=str(response.content).strip(),
+            removed_ids=[m.id for m in messages],
+            seconds=time.perf_counter() - start,
+        )
+
+    def _harvest(self, thread_id: str) -> Optional[SummaryResult]:
+        # 取出已经完成的摘要任务，未完成时返回 None，不阻塞请求
+        with self._lock:
+            future = self._pending.get(thread_id)
+            if future is None or not future.done():
+                return None
+            del self._pending[thread_id]
+        try:
+            result = future.result()
+        except Exception:
+            self.failed += 1
+            return None
+        self.applied += 1
+        self.summarized_messages += len(result.removed_ids)
+        self.background_seconds += result.seconds
+        return result
+
+    def _schedule(self, thread_id: str, summary: str, messages: list[BaseMessage]):
+        with self._lock:
+            if thread_id in self._pending:
+                return
+            self._pending[thread_id] = self._executor.submit(
+                self._summarize, summary, list(messages)
+            )
+            self.scheduled += 1
+
+    def apply(
+        self, state: SummaryState, config: RunnableConfig
+    ) -> tuple[list[BaseMessage], dict]:
+        # 返回 (发给模型的消息, 需要写回状态的字段)；状态更新中的 messages
+        # 是需要删除的旧消息，节点需要在后面追加模型的回答
+        thread_id = config["configurable"]["thread_id"]
+        messages = list(state["messages"])
+        summary = state.get("summary", "")
+        update: dict = {"messages": []}
+
+        result = self._harvest(thread_id)
+        if result is not None:
+            removed = set(result.removed_ids)
+            messages = [m for m in messages if m.id not in removed]
+            summary = result.summary
+            update["summary"] = summary
+            update["messages"] = [RemoveMessage(id=i) for i in result.removed_ids]
+
+        cut = self._cut(messages)
+        if cut:
+            self._schedule(thread_id, summary, messages[:cut])
+
+        prompt = list(messages)
+        if summary:
+            prompt.insert(
+                0, SystemMessage(f"Summary of the earlier conversation:\n{summary}")
+            )
+        return prompt, update
+
+    def wait(self, thread_id: Optional[str] = None) -> None:
+        # 等待后台摘要任务完成（演示和关闭时使用）
+        with self._lock:
+            futures = [
+                f
+                for t, f in self._pending.items()
+                if thread_id is None or t == thread_id
+            ]
+        for future in futures:
+            future.exception()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": self.scheduled,
+            "applied": self.applied,
+            "failed": self.failed,
+            "pending": len(self._pending),
+            "summarized_messages": self.summarized_messages,
+            "background_seconds": round(self.background_seconds, 2),
+        }
+
+
+if __name__ == "__main__":
+    from langchain_ollama import ChatOllama
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import END, START, StateGraph
+
+    model = ChatOllama(model="qwen2.5:32b", base_url="http://localhost:11434")
+    memory = SummaryMemory(model, max_tokens=1500, keep_tokens=600)
+
+    def chatbot(state: SummaryState, config: RunnableConfig):
+        prompt, update = memory.apply(state, config)
+        answer = model.invoke(prompt)
+        return {**update, "messages": update["messages"] + [answer]}
+
+    builder = StateGraph(SummaryState)
+    builder.add_node("chatbot", chatbot)
+    builder.add_edge(START, "chatbot")
+    builder.add_edge("chatbot", END)
+    graph = builder.compile(checkpointer=MemorySaver())
+    thread = {"configurable": {"thread_id": "1"}}
+
+    # 长对话：每轮的 prompt_eval_duration 在超过预算后不再随轮数增长
+    for turn in range(30):
+        question = (
+            "hi, my name is Jack and I live in Paris."
+            if turn == 0
+            else f"Tell me one short fact about the number {turn}."
+        )
+        result = graph.invoke({"messages": [HumanMessage(question)]}, thread)
+        metadata = result["messages"][-1].response_metadata
+        print(
+            f"turn {turn:>2}: {len(result['messages']):>3} messages, "
+            f"prompt_eval_count={metadata.get('prompt_eval_count')}, "
+            f"prompt_eval={metadata.get('prompt_eval_duration', 0) / 1e6:.0f}ms"
+        )
+    memory.wait()
+    result = graph.invoke({"messages": [HumanMessage("what is my name?")]}, thread)
+    print(result["messages"][-1].content)
+    print(graph.get_state(thread).values.get("summary"))
+    print(memory.stats())
+    memory.close()
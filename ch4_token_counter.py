@@ -0,0 +1,112 @@
+import json
+import sys
+import time
+from functools import lru_cache
+from typing import Optional, Sequence
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    trim_messages,
+)
+
+from ch5_context_packing import LocalTokenizer
+
+# qwen2.5 的对话模板（ChatML）：<|im_start|>{role}\n{content}<|im_end|>\n
+ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool"}
+
+
+def message_text(message: BaseMessage) -> str:
+    text = (
+        message.content
+        if isinstance(message.content, str)
+        else json.dumps(message.content, ensure_ascii=False)
+    )
+    if isinstance(message, AIMessage) and message.tool_calls:
+        text += json.dumps(message.tool_calls, ensure_ascii=False)
+    return text
+
+
+# 离线 token 计数器，可以直接作为 trim_messages 的 token_counter
+# - 使用本地的 qwen2.5 分词器，不需要访问模型服务
+# - 按 (角色, 文本) 记忆每条消息的 token 数：trim_messages 会反复计算同一批消息的
+#   不同前缀，历史中的旧消息每轮也都会再算一次，命中缓存后只剩一次字典查找
+# maxsize=0 时不缓存，用作对照
+class QwenTokenCounter:
+    def __init__(self, tokenizer: Optional[LocalTokenizer] = None, maxsize=100_000):
+        self.tokenizer = tokenizer or LocalTokenizer()
+        self._count = lru_cache(maxsize=maxsize)(self._count_uncached)
+
+    def _count_uncached(self, role: str, text: str) -> int:
+        # 模板中的 <|im_start|>、<|im_end|> 是特殊 token，各计 1 个
+        return self.tokenizer.count(f"{role}\n{text}\n") + 2
+
+    def count_message(self, message: BaseMessage) -> int:
+        return self._count(ROLES.get(message.type, message.type), message_text(message))
+
+    def __call__(self, messages: Sequence[BaseMessage]) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+    def stats(self) -> dict:
+        info = self._count.cache_info()
+        total = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / total, 4) if total else 0.0,
+            "entries": info.currsize,
+        }
+
+
+def make_history(n: int) -> list[BaseMessage]:
+    messages: list[BaseMessage] = [SystemMessage("you're a good assistant")]
+    for i in range(n // 2):
+        messages.append(HumanMessage(f"question {i}: what happened on day {i}?"))
+        messages.append(AIMessage(f"On day {i} the little prince met a new friend."))
+    return messages
+
+
+def benchmark(token_counter, history_sizes=(10, 100, 1000), turns=20) -> None:
+    # 模拟对话：每轮追加一问一答，然后裁剪，统计每轮裁剪的平均耗时
+    for n in history_sizes:
+        history = make_history(n)
+        trimmer = trim_messages(
+            max_tokens=2000,
+            strategy="last",
+            token_counter=token_counter,
+            include_system=True,
+            allow_partial=False,
+            start_on="human",
+        )
+        trimmer.invoke(history)  # 预热
+        start = time.perf_counter()
+        for turn in range(turns):
+            history.append(HumanMessage(f"follow-up {turn}"))
+            history.append(AIMessage(f"answer {turn}"))
+            trimmer.invoke(history)
+        per_turn = (time.perf_counter() - start) * 1000 / turns
+        print(f"  {n:>5} messages: {per_turn:8.3f}ms/turn")
+
+
+if __name__ == "__main__":
+    tokenizer = LocalTokenizer()
+
+    print("memoized qwen2.5 tokenizer:")
+    counter = QwenTokenCounter(tokenizer)
+    benchmark(counter)
+    print(" ", counter.stats())
+
+    print("qwen2.5 tokenizer without memoization:")
+    benchmark(QwenTokenCounter(tokenizer, maxsize=0))
+
+    if "--ollama" in sys.argv:
+        # 原来的方式：ChatOllama.get_num_tokens_from_messages（通用 GPT-2 分词器）
+        from langchain_ollama import ChatOllama
+
+        print("ChatOllama token counter:")
+        benchmark(
+            ChatOllama(model="qwen2.5:32b", base_url="http://localhost:11434"),
+            turns=3,
+        )
@@ -1,16 +1,23 @@
+import time
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Annotated, Literal, TypedDict
 
 from langchain_core.documents import Document
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.vectorstores.in_memory import InMemoryVectorStore
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
 # from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 
-embeddings = OllamaEmbeddings(
-    base_url="http://localhost:11434", model="nomic-embed-text"
+from ch2_embedding_cache import CachedEmbeddings
+from ch3_semantic_router import SemanticRouter
+from ch5_context_packing import ContextPacker
+from ch5_numpy_vectorstore import NumpyVectorStore
+
+embeddings = CachedEmbeddings(
+    OllamaEmbeddings(base_url="http://localhost:11434", model="nomic-embed-text")
 )
 
 # useful to generate SQL query
@@ -33,6 +40,9 @@ class State(TypedDict):
     domain: Literal["records", "insurance"]
     documents: list[Document]
     answer: str
+    # 推测执行模式下两个领域的检索结果分别存放，路由结果出来后再选用其中一个
+    records_documents: list[Document]
+    insurance_documents: list[Document]
 
 
 class Input(TypedDict):
@@ -44,13 +54,15 @@ class Output(TypedDict):
     answer: str
 
 
-medical_records_store = InMemoryVectorStore.from_documents(
-    documents=[], embedding=embeddings
+# 向量库快照保存在本地，重启时内存映射加载，不需要重新嵌入；
+# 病历库规模大，启用 IVF 近似索引（达到 min_train_size 后自动训练）
+medical_records_store = NumpyVectorStore.load_or_create(
+    "./.cache/medical_records_store", embeddings, [], index="ivf"
 )
 medical_records_retriever = medical_records_store.as_retriever()
 
-insurance_faqs_store = InMemoryVectorStore.from_documents(
-    documents=[], embedding=embeddings
+insurance_faqs_store = NumpyVectorStore.load_or_create(
+    "./.cache/insurance_faqs_store", embeddings, []
 )
 insurance_faqs_retriever = insurance_faqs_store.as_retriever()
 
@@ -82,6 +94,83 @@ def router_node(state: State) -> State:
     }
 
 
+# 混合路由：先用嵌入相似度分类（一次嵌入 + 一次矩阵乘法），
+# 只有置信度不够时才回退到 LLM 路由，省掉大部分 qwen2.5:32b 的生成
+route_examples = {
+    "records": [
+        "What was my last diagnosis?",
+        "Which medications am I currently taking?",
+        "What dosage of metformin was I prescribed?",
+        "When was my last blood test and what were the results?",
+        "What treatment did the doctor recommend for my back pain?",
+        "Do I have any known allergies on file?",
+    ],
+    "insurance": [
+        "Am I covered for COVID-19 treatment?",
+        "How do I file a claim?",
+        "What is my deductible?",
+        "Does my policy cover dental care?",
+        "How long does claim reimbursement take?",
+        "Is a specialist visit covered without a referral?",
+    ],
+}
+
+
+# 路由矩阵在第一次路由时才加载或构建，缓存为空时导入本模块不会调用嵌入模型
+@lru_cache(maxsize=1)
+def get_semantic_router() -> SemanticRouter:
+    return SemanticRouter.load_or_build(
+        "./.cache/ch5_3_router.npz", embeddings, route_examples, top_k=1
+    )
+
+
+# 最高分与次高分之差低于该值时认为不够确定，交给 LLM 判断
+ROUTER_MIN_MARGIN = 0.05
+# 最高分本身也需要达到一定的相似度
+ROUTER_MIN_SCORE = 0.5
+
+
+@dataclass
+class HybridRouterStats:
+    fast_path: int = 0
+    llm_path: int = 0
+    fast_seconds: float = 0.0
+    llm_seconds: float = 0.0
+
+    def summary(self) -> dict:
+        avg_fast = self.fast_seconds / self.fast_path if self.fast_path else 0.0
+        avg_llm = self.llm_seconds / self.llm_path if self.llm_path else 0.0
+        return {
+            "fast_path": self.fast_path,
+            "llm_path": self.llm_path,
+            "avg_fast_ms": round(avg_fast * 1000, 1),
+            "avg_llm_ms": round(avg_llm * 1000, 1),
+            # 按 LLM 路由的平均耗时估算快速路径节省的时间
+            "saved_seconds": round(self.fast_path * max(avg_llm - avg_fast, 0.0), 2),
+        }
+
+
+router_stats = HybridRouterStats()
+
+
+def hybrid_router_node(state: State) -> State:
+    start = time.perf_counter()
+    result = get_semantic_router().route(state["user_query"])
+    best, second = sorted(result.scores.values(), reverse=True)[:2]
+    if best >= ROUTER_MIN_SCORE and best - second >= ROUTER_MIN_MARGIN:
+        router_stats.fast_path += 1
+        router_stats.fast_seconds += time.perf_counter() - start
+        return {
+            "domain": result.route,
+            "messages": [HumanMessage(state["user_query"]), AIMessage(result.route)],
+        }
+
+    update = router_node(state)
+    router_stats.llm_path += 1
+    router_stats.llm_seconds += time.perf_counter() - start
+    return update
+
+
 def pick_retriever(
     state: State,
 ) -> Literal["retrieve_medical_records", "retrieve_insurance_faqs"]:
@@ -120,16 +209,46 @@ insurance_faqs_prompt = SystemMessage(
 )
 
 
+# 推测执行：两个检索节点与路由节点同时从 START 开始运行，
+# 检索延迟被 LLM 路由的延迟掩盖；三者都完成后再按路由结果选用对应的文档
+def speculative_retrieve_medical_records(state: State) -> State:
+    return {
+        "records_documents": medical_records_retriever.invoke(state["user_query"]),
+    }
+
+
+def speculative_retrieve_insurance_faqs(state: State) -> State:
+    return {
+        "insurance_documents": insurance_faqs_retriever.invoke(state["user_query"]),
+    }
+
+
+def pick_documents(state: State) -> State:
+    # 另一个领域的检索结果直接丢弃
+    if state["domain"] == "records":
+        return {"documents": state["records_documents"]}
+    else:
+        return {"documents": state["insurance_documents"]}
+
+
+# 检索到的文档去重、去掉 repr 噪音并按 token 预算打包后再放进提示词；
+# 第一次生成回答时才加载分词器，导入本模块不需要访问 Hugging Face
+@lru_cache(maxsize=1)
+def get_context_packer() -> ContextPacker:
+    return ContextPacker(max_tokens=1500)
+
+
 def generate_answer(state: State) -> State:
     prompt = (
         medical_records_prompt
         if state["domain"] == "records"
         else insurance_faqs_prompt
     )
+    packed = get_context_packer().pack(state["documents"])
     messages = [
         prompt,
         *state["messages"],
-        HumanMessage(f"Documents: {state['documents']}"),
+        HumanMessage(f"Documents:\n{packed.text}"),
     ]
     res = model_high_temp.invoke(messages)
     return {
@@ -139,6 +258,28 @@ def generate_answer(state: State) -> State:
     }
 
 
+def build_speculative_graph():
+    builder = StateGraph(State, input=Input, output=Output)
+    builder.add_node("router", hybrid_router_node)
+    builder.add_node("retrieve_medical_records", speculative_retrieve_medical_records)
+    builder.add_node("retrieve_insurance_faqs", speculative_retrieve_insurance_faqs)
+    builder.add_node("pick_documents", pick_documents)
+    builder.add_node("generate_answer", generate_answer)
+
+    # 从 START 扇出：路由和两个检索在同一个超步中并发执行
+    builder.add_edge(START, "router")
+    builder.add_edge(START, "retrieve_medical_records")
+    builder.add_edge(START, "retrieve_insurance_faqs")
+    # 等三个节点都完成后再选择文档
+    builder.add_edge(
+        ["router", "retrieve_medical_records", "retrieve_insurance_faqs"],
+        "pick_documents",
+    )
+    builder.add_edge("pick_documents", "generate_answer")
+    builder.add_edge("generate_answer", END)
+    return builder.compile()
+
+
 if __name__ == "__main__":
     # 创建一个StateGraph对象，指定状态类型、输入和输出
     # 这是LangGraph的核心，用于定义整个工作流程
@@ -147,8 +288,8 @@ if __name__ == "__main__":
     # 添加所有的节点到图中
     # 每个节点都是一个处理步骤，接收状态并返回更新后的状态
     builder.add_node(
-        node="router", action=router_node
-    )  # 路由节点，决定查询应该被发送到哪个领域
+        node="router", action=hybrid_router_node
+    )  # 路由节点，决定查询应该被发送到哪个领域（嵌入快速路径 + LLM 兜底）
     builder.add_node(
         node="retrieve_medical_records", action=retrieve_medical_records
     )  # 检索医疗记录的节点
@@ -192,6 +333,17 @@ if __name__ == "__main__":
     for chunk in graph.stream(input):
         print(chunk)  # 打印每一步执行的结果，便于调试和观察
 
+    # 推测执行模式：检索与路由并发，generate_answer 只使用路由选中领域的文档
+    speculative_graph = build_speculative_graph()
+    start = time.perf_counter()
+    for chunk in speculative_graph.stream(input):
+        print(chunk)
+    print(f"speculative mode: {time.perf_counter() - start:.2f}s")
+
+    # 打印两条路由路径各自的次数和节省的时间
+    print(router_stats.summary())
+    print(get_context_packer().totals.summary())
+
 # 输出结果说明:
 # 首先，路由器确定查询与"insurance"领域相关
 # 然后，系统检索保险FAQ（这里没有实际文档，所以返回空列表）
@@ -0,0 +1,250 @@
+import glob
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536):
+    # 分块计算最近的质心，避免一次性生成 (N, nlist) 的大矩阵
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        sims = vectors[start : start + chunk] @ centroids.T
+        out[start : start + chunk] = sims.argmax(axis=1)
+    return out
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, nlist: int, iters: int = 10, seed: int = 0
+) -> np.ndarray:
+    # 向量已归一化，用内积代替欧氏距离；空簇用随机样本重新初始化
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+# IVF（倒排文件）近似最近邻索引
+# - 用 k-means 把向量划分成 nlist 个簇，查询时只扫描与查询最相似的 nprobe 个簇
+# - nprobe 越大召回越高、延迟越大；nprobe == nlist 时等价于精确搜索
+# - 向量数达到 min_train_size 之前不训练，搜索返回 None，由调用方做精确搜索
+# - 训练后的插入只做一次质心分配（增量）；数据分布变化较大时可以调用 retrain
+# 索引只保存行号，向量本身仍在向量库的矩阵中
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(
+        self,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        min_train_size: int = 10_000,
+        max_train_size: int = 200_000,
+        iters: int = 10,
+        seed: int = 0,
+    ):
+        # nlist 为 None 时按训练时的数据量取 4 * sqrt(N)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.max_train_size = max_train_size
+        self.iters = iters
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._count = 0
+        self._lists: list[list[int]] = []
+        # 每个簇行号的 ndarray 缓存，簇被修改后置为 None
+        self._arrays: list[Optional[np.ndarray]] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def params(self) -> dict:
+        return {
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "min_train_size": self.min_train_size,
+            "max_train_size": self.max_train_size,
+            "iters": self.iters,
+            "seed": self.seed,
+        }
+
+    def _set_assign(self, assign: np.ndarray) -> None:
+        self._assign = assign.astype(np.int32)
+        self._count = len(assign)
+        order = np.argsort(self._assign, kind="stable")
+        sizes = np.bincount(self._assign, minlength=len(self.centroids))
+        self._lists = [part.tolist() for part in np.split(order, np.cumsum(sizes)[:-1])]
+        self._arrays = [None] * len(self.centroids)
+
+    def train(self, vectors: np.ndarray) -> None:
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        self.nlist = nlist
+        rng = np.random.default_rng(self.seed)
+        sample = vectors
+        if len(vectors) > self.max_train_size:
+            rows = rng.choice(len(vectors), self.max_train_size, replace=False)
+            sample = vectors[np.sort(rows)]
+        sample = np.asarray(sample, dtype=np.float32)
+        self.centroids = spherical_kmeans(sample, nlist, self.iters, self.seed)
+        self._set_assign(_nearest(vectors, self.centroids))
+
+    def retrain(self, vectors: np.ndarray) -> None:
+        self.centroids = None
+        self.train(vectors)
+
+    def add(self, vectors: np.ndarray, start: int) -> None:
+        # vectors 是向量库当前的全部向量，[start:] 为新插入的行
+        if not self.trained:
+            if len(vectors) >= self.min_train_size:
+                self.train(vectors)
+            return
+        assign = _nearest(np.asarray(vectors[start:]), self.centroids)
+        if len(vectors) > len(self._assign):
+            grown = np.empty(max(len(vectors), 2 * len(self._assign)), np.int32)
+            grown[: self._count] = self._assign[: self._count]
+            self._assign = grown
+        self._assign[start : len(vectors)] = assign
+        self._count = len(vectors)
+        for offset, c in enumerate(assign.tolist()):
+            self._lists[c].append(start + offset)
+            self._arrays[c] = None
+
+    def remove(self, row: int, last: int) -> None:
+        # 与向量库的删除方式一致：删除 row，再把最后一行 last 移到 row
+        if not self.trained:
+            return
+        c = int(self._assign[row])
+        self._lists[c].remove(row)
+        self._arrays[c] = None
+        if row != last:
+            moved = int(self._assign[last])
+            members = self._lists[moved]
+            members[members.index(last)] = row
+            self._arrays[moved] = None
+            self._assign[row] = moved
+        self._count -= 1
+
+    def _rows(self, c: int) -> np.ndarray:
+        rows = self._arrays[c]
+        if rows is None:
+            rows = self._arrays[c] = np.asarray(self._lists[c], dtype=np.int64)
+        return rows
+
+    def search(self, query: np.ndarray, nprobe: Optional[int] = None):
+        # 返回候选行号；未训练时返回 None 表示需要精确搜索
+        if not self.trained:
+            return None
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._rows(c) for c in probes])
+
+    def state(self) -> dict:
+        state = {"params": self.params()}
+        if self.trained:
+            state["centroids"] = self.centroids
+            state["assign"] = self._assign[: self._count]
+        return state
+
+    @classmethod
+    def from_state(cls, state: dict) -> "IVFIndex":
+        index = cls(**state["params"])
+        if "centroids" in state:
+            index.centroids = np.asarray(state["centroids"], dtype=np.float32)
+            index._set_assign(np.asarray(state["assign"]))
+        return index
+
+
+INDEX_TYPES = {IVFIndex.kind: IVFIndex}
+
+
+def exact_top_k(matrix: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ matrix.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, 1)), 1)
+
+
+def ivf_top_k(matrix, index: IVFIndex, query: np.ndarray, k: int, nprobe: int):
+    rows = index.search(query, nprobe)
+    scores = matrix[rows] @ query
+    k = min(k, len(rows))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return rows[top[np.argsort(-scores[top])]]
+
+
+if __name__ == "__main__":
+    from langchain_community.document_loaders import TextLoader
+    from langchain_ollama import OllamaEmbeddings
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    from ch2_embedding_cache import CachedEmbeddings
+
+    # 用法：python ch5_ann_index.py [目标向量数]
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    embeddings = CachedEmbeddings(
+        OllamaEmbeddings(base_url="http://localhost:11434", model="nomic-embed-text")
+    )
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = []
+    for path in sorted(glob.glob("./resources/*.txt")):
+        chunks.extend(splitter.split_documents(TextLoader(path, "utf-8").load()))
+    base = _normalize(
+        np.asarray(
+            embeddings.embed_documents([c.page_content for c in chunks]), np.float32
+        )
+    )
+    print(f"{len(base)} real chunk embeddings from resources/*.txt")
+
+    # 真实语料只有几千个分块，在真实嵌入周围加噪声扩充到 target 个向量
+    rng = np.random.default_rng(0)
+    copies = max(1, target // len(base))
+    noise = rng.normal(scale=0.05, size=(copies, *base.shape)).astype(np.float32)
+    matrix = _normalize((base[None] + noise).reshape(-1, base.shape[1]))
+    queries = _normalize(
+        base[rng.choice(len(base), 200)]
+        + rng.normal(scale=0.05, size=(200, base.shape[1])).astype(np.float32)
+    )
+    k = 10
+
+    start = time.perf_counter()
+    truth = exact_top_k(matrix, queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    # 逐条查询计时，与 ANN 的单条查询延迟可比
+    start = time.perf_counter()
+    for q in queries[:50]:
+        exact_top_k(matrix, q[None], k)
+    exact_single_ms = (time.perf_counter() - start) * 1000 / 50
+    print(f"exact: {exact_single_ms:.2f}ms/query ({exact_ms:.2f}ms batched)")
+
+    index = IVFIndex(min_train_size=0)
+    start = time.perf_counter()
+    index.add(matrix, 0)
+    print(f"ivf train: nlist={index.nlist} in {time.perf_counter() - start:.1f}s")
+
+    for nprobe in (1, 2, 4, 8, 16, 32, 64):
+        hits = 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            found = ivf_top_k(matrix, index, q, k, nprobe)
+            hits += len(set(found.tolist()) & set(expected.tolist()))
+        latency = (time.perf_counter() - start) * 1000 / len(queries)
+        print(
+            f"nprobe={nprobe:<3} recall@{k}={hits / truth.size:.3f} "
+            f"{latency:.2f}ms/query speedup {exact_single_ms / latency:.1f}x"
+        )
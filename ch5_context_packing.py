@@ -0,0 +1,239 @@
+import hashlib
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Sequence
+
+from langchain_core.documents import Document
+from tokenizers import Tokenizer
+
+# qwen2.5 各个尺寸共用同一个分词器；第一次使用时从 Hugging Face 下载并保存到本地，
+# 之后完全离线加载
+DEFAULT_TOKENIZER_PATH = "./.cache/qwen2.5-tokenizer.json"
+DEFAULT_TOKENIZER_REPO = "Qwen/Qwen2.5-32B-Instruct"
+
+
+def load_tokenizer(
+    path: str = DEFAULT_TOKENIZER_PATH, repo: str = DEFAULT_TOKENIZER_REPO
+) -> Tokenizer:
+    if Path(path).exists():
+        return Tokenizer.from_file(path)
+    tokenizer = Tokenizer.from_pretrained(repo)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tokenizer.save(path)
+    return tokenizer
+
+
+# 本地分词器：Rust 实现的 tokenizers，计数不需要调用模型服务
+class LocalTokenizer:
+    def __init__(self, tokenizer: Optional[Tokenizer] = None):
+        self.tokenizer = tokenizer or load_tokenizer()
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count_batch(self, texts: Sequence[str]) -> list[int]:
+        encodings = self.tokenizer.encode_batch(list(texts), add_special_tokens=False)
+        return [len(e.ids) for e in encodings]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        # 按 token 截断，在最后一个保留的 token 的字符偏移处切开
+        if max_tokens <= 0:
+            return ""
+        encoding = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        return text[: encoding.offsets[max_tokens - 1][1]]
+
+
+def _overlap(a: str, b: str, min_len: int) -> int:
+    # a 的结尾与 b 的开头重合的最大长度（切分时的 chunk_overlap），不足 min_len 视为 0
+    probe = b[:min_len]
+    if len(probe) < min_len:
+        return 0
+    # 从最长的可能重叠开始找，第一个匹配就是最大重叠
+    start = max(0, len(a) - len(b))
+    while True:
+        pos = a.find(probe, start)
+        if pos < 0:
+            return 0
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        start = pos + 1
+
+
+def clean_text(text: str) -> str:
+    # 合并多余的空白，保留段落分隔
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    return text.strip()
+
+
+@dataclass
+class PackStats:
+    docs_in: int = 0
+    docs_used: int = 0
+    duplicates: int = 0
+    truncated: int = 0
+    # 原来 f"Documents: {docs}" 方式的 token 数，以及打包后的 token 数
+    baseline_tokens: int = 0
+    packed_tokens: int = 0
+    seconds: float = 0.0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.baseline_tokens - self.packed_tokens
+
+    def __str__(self) -> str:
+        return (
+            f"{self.docs_used}/{self.docs_in} docs ({self.duplicates} duplicates, "
+            f"{self.truncated} truncated), {self.baseline_tokens} -> "
+            f"{self.packed_tokens} tokens (saved {self.saved_tokens}), "
+            f"{self.seconds * 1000:.1f}ms"
+        )
+
+
+@dataclass
+class PackedContext:
+    text: str
+    documents: list[Document]
+    stats: PackStats
+
+
+@dataclass
+class PackingTotals:
+    requests: int = 0
+    baseline_tokens: int = 0
+    packed_tokens: int = 0
+    history: list[PackStats] = field(default_factory=list)
+
+    def record(self, stats: PackStats) -> None:
+        self.requests += 1
+        self.baseline_tokens += stats.baseline_tokens
+        self.packed_tokens += stats.packed_tokens
+        self.history = self.history[-999:] + [stats]
+
+    def summary(self) -> dict:
+        saved = self.baseline_tokens - self.packed_tokens
+        return {
+            "requests": self.requests,
+            "baseline_tokens": self.baseline_tokens,
+            "packed_tokens": self.packed_tokens,
+            "saved_tokens": saved,
+            "avg_saved_per_request": round(saved / self.requests, 1)
+            if self.requests
+            else 0.0,
+        }
+
+
+# 上下文打包：把检索到的文档整理成紧凑的纯文本再放进提示词
+# 1. 按相关度排序（有 scores 时按分数，否则保持检索器返回的顺序）
+# 2. 去重：内容相同或被已选文档包含的丢弃；与已选文档首尾重叠（切分的 chunk_overlap）
+#    的部分裁掉
+# 3. 去掉 Document 的 repr 噪音，只保留正文和 metadata_keys 中的字段
+# 4. 按 token 预算依次放入，放不下的最后一个文档按 token 截断（剩余预算太少时丢弃）
+class ContextPacker:
+    def __init__(
+        self,
+        tokenizer: Optional[LocalTokenizer] = None,
+        max_tokens: int = 1500,
+        metadata_keys: Sequence[str] = ("source",),
+        min_overlap: int = 50,
+        min_tail_tokens: int = 64,
+    ):
+        self.tokenizer = tokenizer or LocalTokenizer()
+        self.max_tokens = max_tokens
+        self.metadata_keys = metadata_keys
+        self.min_overlap = min_overlap
+        self.min_tail_tokens = min_tail_tokens
+        self.totals = PackingTotals()
+
+    def _dedup(self, docs: list[Document]) -> tuple[list[tuple[Document, str]], int]:
+        kept: list[tuple[Document, str]] = []
+        seen = set()
+        duplicates = 0
+        for doc in docs:
+            text = clean_text(doc.page_content)
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            if not text or digest in seen or any(text in t for _, t in kept):
+                duplicates += 1
+                continue
+            seen.add(digest)
+            for _, other in kept:
+                k = _overlap(other, text, self.min_overlap)
+                if k:
+                    text = text[k:].lstrip()
+            kept.append((doc, text))
+        return kept, duplicates
+
+    def _render(self, n: int, doc: Document, text: str) -> str:
+        meta = ", ".join(
+            f"{key}: {doc.metadata[key]}"
+            for key in self.metadata_keys
+            if key in doc.metadata
+        )
+        header = f"[{n}] ({meta})" if meta else f"[{n}]"
+        return f"{header}\n{text}"
+
+    def pack(
+        self,
+        docs: Sequence[Document],
+        scores: Optional[Sequence[float]] = None,
+        max_tokens: Optional[int] = None,
+    ) -> PackedContext:
+        start = time.perf_counter()
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        stats = PackStats(docs_in=len(docs))
+        stats.baseline_tokens = self.tokenizer.count(f"Documents: {list(docs)}")
+
+        ordered = list(docs)
+        if scores is not None:
+            ranked = sorted(zip(scores, range(len(docs))), key=lambda x: -x[0])
+            ordered = [docs[i] for _, i in ranked]
+        kept, stats.duplicates = self._dedup(ordered)
+
+        blocks = [self._render(n, doc, text) for n, (doc, text) in enumerate(kept, 1)]
+        # 分隔符 "\n\n" 的 token 数按 1 计
+        counts = self.tokenizer.count_batch(blocks)
+        parts, used, selected = [], 0, []
+        for (doc, _), block, count in zip(kept, blocks, counts):
+            sep = 1 if parts else 0
+            remaining = budget - used - sep
+            if count > remaining:
+                if remaining >= self.min_tail_tokens:
+                    parts.append(self.tokenizer.truncate(block, remaining))
+                    selected.append(doc)
+                    stats.truncated += 1
+                break
+            parts.append(block)
+            selected.append(doc)
+            used += count + sep
+
+        text = "\n\n".join(parts)
+        stats.docs_used = len(selected)
+        stats.packed_tokens = self.tokenizer.count(f"Documents:\n{text}")
+        stats.seconds = time.perf_counter() - start
+        self.totals.record(stats)
+        return PackedContext(text=text, documents=selected, stats=stats)
+
+
+if __name__ == "__main__":
+    from langchain_community.document_loaders import TextLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # 与 ch3_1_RAG2.ipynb 相同的切分参数：相邻分块有 200 个字符重叠
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = splitter.split_documents(
+        TextLoader("./resources/the_little_prince.txt", encoding="utf-8").load()
+    )
+    # 模拟检索结果：相邻的重叠分块，外加一个重复
+    retrieved = chunks[40:44] + [chunks[41]]
+
+    packer = ContextPacker(max_tokens=600)
+    packed = packer.pack(retrieved)
+    print(packed.stats)
+    print(packed.text[:500])
+    for budget in (200, 400, 800, 1600):
+        print(f"budget {budget}: {packer.pack(retrieved, max_tokens=budget).stats}")
+    print(packer.totals.summary())
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Sequence, Union
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_ollama import OllamaEmbeddings
+
+from ch2_embedding_cache import CachedEmbeddings
+from ch5_ann_index import INDEX_TYPES, IVFIndex
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def documents_fingerprint(documents: Sequence[Document]) -> str:
+    digest = hashlib.sha256()
+    for doc in documents:
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(json.dumps(doc.metadata, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# 基于连续 NumPy 矩阵的本地向量库，用来替代 InMemoryVectorStore
+# - 向量归一化后按行存放在一个 float32 矩阵中，查询只需一次矩阵-向量乘法加 argpartition
+# - 支持增量 add/delete（删除时把最后一行移到空位，O(1)）
+# - save/load 快照：向量存成 .npy，加载时可以直接内存映射，启动只是打开文件
+# - index 可选 "ivf"（或 IVFIndex 实例）启用近似搜索，默认 None 为精确搜索
+class NumpyVectorStore(VectorStore):
+    def __init__(
+        self, embedding: Embeddings, index: Union[str, IVFIndex, None] = None
+    ):
+        self.embedding = embedding
+        self.index = INDEX_TYPES[index]() if isinstance(index, str) else index
+        self._matrix: Optional[np.ndarray] = None
+        self._count = 0
+        self._ids: list[str] = []
+        self._docs: list[Document] = []
+        self._rows: dict[str, int] = {}
+        # 快照对应的文档指纹，用于判断快照是否过期
+        self.fingerprint = ""
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[: self._count]
+
+    def set_index(self, index: Union[str, IVFIndex, None]) -> None:
+        # 为已有向量建立（或移除）索引，不需要重新嵌入
+        self.index = INDEX_TYPES[index]() if isinstance(index, str) else index
+        if self.index is not None and self._count:
+            self.index.add(self.vectors, 0)
+
+    def _reserve(self, extra: int, dim: int) -> None:
+        if self._matrix is None:
+            self._matrix = np.empty((max(extra, 16), dim), dtype=np.float32)
+            return
+        full = self._count + extra > len(self._matrix)
+        if full or not self._matrix.flags.writeable:
+            # 容量翻倍，摊还 O(1)；内存映射加载的只读矩阵在第一次写入时复制
+            capacity = max(len(self._matrix) * 2, self._count + extra, 16)
+            grown = np.empty((capacity, dim), dtype=np.float32)
+            grown[: self._count] = self._matrix[: self._count]
+            self._matrix = grown
+
+    def add_vectors(
+        self,
+        vectors: Sequence[Sequence[float]],
+        documents: Sequence[Document],
+        ids: Optional[Sequence[str]] = None,
+    ) -> list[str]:
+        if not ids:
+            ids = [doc.id or str(uuid.uuid4()) for doc in documents]
+        ids = list(ids)
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        if len(vectors) == 0:
+            return []
+        # 同一批中重复的 id 只保留最后一次出现，和逐个 add 的结果一致
+        last = {doc_id: position for position, doc_id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            vectors = vectors[keep]
+            documents = [documents[position] for position in keep]
+            unique_ids = [ids[position] for position in keep]
+        else:
+            unique_ids = ids
+        # 已存在的 id 视为更新：先删除旧的行
+        self.delete([i for i in unique_ids if i in self._rows])
+        self._reserve(len(vectors), vectors.shape[1])
+        self._matrix[self._count : self._count + len(vectors)] = vectors
+        for offset, (doc_id, doc) in enumerate(zip(unique_ids, documents)):
+            self._rows[doc_id] = self._count + offset
+            self._ids.append(doc_id)
+            self._docs.append(
+                Document(
+                    id=doc_id, page_content=doc.page_content, metadata=doc.metadata
+                )
+            )
+        self._count += len(vectors)
+        if self.index is not None:
+            self.index.add(self.vectors, self._count - len(vectors))
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        return self.add_vectors(self.embedding.embed_documents(texts), documents, ids)
+
+    def add_documents(self, documents: list[Document], **kwargs: Any) -> list[str]:
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embedding.embed_documents(texts)
+        return self.add_vectors(vectors, documents, kwargs.get("ids"))
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        for doc_id in ids or []:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                continue
+            last = self._count - 1
+            if self.index is not None:
+                self.index.remove(row, last)
+            if row != last:
+                # 把最后一行移到被删除的位置，保持矩阵连续
+                if not self._matrix.flags.writeable:
+                    self._matrix = np.array(self._matrix[: self._count])
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = self._ids[last]
+                self._docs[row] = self._docs[last]
+                self._rows[self._ids[row]] = row
+            self._ids.pop()
+            self._docs.pop()
+            self._count -= 1
+        return True
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        return [self._docs[self._rows[i]] for i in ids if i in self._rows]
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        filter: Optional[Callable[[Document], bool]] = None,
+        nprobe: Optional[int] = None,
+    ) -> list[tuple[Document, float]]:
+        if self._count == 0:
+            return []
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        rows = None
+        if self.index is not None:
+            # nprobe 可以按查询覆盖索引的默认值，用召回换延迟
+            rows = self.index.search(query, nprobe)
+        if rows is None:
+            rows = np.arange(self._count)
+            scores = self.vectors @ query
+        else:
+            scores = self.vectors[rows] @ query
+        if filter is not None:
+            mask = np.fromiter((filter(self._docs[i]) for i in rows), dtype=bool)
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+        # argpartition 取出 top-k，再只对这 k 个排序
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (self._docs[rows[i]], float(scores[i]))
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, **kwargs
+            )
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return self.similarity_search_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # 得分本身就是余弦相似度
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding)
+        if texts:
+            store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    def save(self, path: str, fingerprint: str = "") -> None:
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再原子替换：当前矩阵可能正映射着旧的 vectors.npy，
+        # 并且 docs.json 最后替换，中途崩溃不会留下不一致的快照
+        with open(directory / "vectors.npy.tmp", "wb") as f:
+            np.save(f, self.vectors)
+        os.replace(directory / "vectors.npy.tmp", directory / "vectors.npy")
+        index_kind = self.index.kind if self.index is not None else None
+        if self.index is not None:
+            state = self.index.state()
+            with open(directory / "index.npz.tmp", "wb") as f:
+                np.savez(f, params=json.dumps(state.pop("params")), **state)
+            os.replace(directory / "index.npz.tmp", directory / "index.npz")
+        with open(directory / "docs.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "fingerprint": fingerprint,
+                    "index": index_kind,
+                    "ids": self._ids,
+                    "docs": [
+                        {"page_content": d.page_content, "metadata": d.metadata}
+                        for d in self._docs
+                    ],
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(directory / "docs.json.tmp", directory / "docs.json")
+
+    @classmethod
+    def load(
+        cls, path: str, embedding: Embeddings, mmap: bool = True
+    ) -> "NumpyVectorStore":
+        directory = Path(path)
+        store = cls(embedding)
+        with open(directory / "docs.json", encoding="utf-8") as f:
+            data = json.load(f)
+        matrix = np.load(directory / "vectors.npy", mmap_mode="r" if mmap else None)
+        store.fingerprint = data.get("fingerprint", "")
+        if len(matrix):
+            store._matrix = matrix
+        store._count = len(matrix)
+        store._ids = data["ids"]
+        store._docs = [
+            Document(id=i, **doc) for i, doc in zip(store._ids, data["docs"])
+        ]
+        store._rows = {doc_id: row for row, doc_id in enumerate(store._ids)}
+        if data.get("index"):
+            with np.load(directory / "index.npz") as saved:
+                state = {name: saved[name] for name in saved.files}
+            state["params"] = json.loads(str(state["params"]))
+            store.index = INDEX_TYPES[data["index"]].from_state(state)
+        return store
+
+    @classmethod
+    def load_or_create(
+        cls,
+        path: str,
+        embedding: Embeddings,
+        documents: Sequence[Document],
+        index: Union[str, IVFIndex, None] = None,
+    ) -> "NumpyVectorStore":
+        # 快照存在且文档没有变化时直接加载，否则重新嵌入并写快照
+        fingerprint = documents_fingerprint(documents)
+        if (Path(path) / "docs.json").exists():
+            store = cls.load(path, embedding)
+            if store.fingerprint == fingerprint:
+                kind = index if isinstance(index, str) else getattr(index, "kind", None)
+                if kind != getattr(store.index, "kind", None):
+                    # 只是索引类型变了：在已有向量上重建索引
+                    store.set_index(index)
+                    store.save(path, fingerprint)
+                return store
+        store = cls(embedding, index)
+        if documents:
+            store.add_documents(list(documents))
+        store.save(path, fingerprint)
+        return store
+
+
+if __name__ == "__main__":
+    embeddings = CachedEmbeddings(
+        OllamaEmbeddings(base_url="http://localhost:11434", model="nomic-embed-text")
+    )
+    with open("./resources/the_little_prince.txt", encoding="utf-8") as f:
+        paragraphs = [p for p in f.read().split("\n\n") if p.strip()]
+    documents = [
+        Document(page_content=p, metadata={"paragraph": i})
+        for i, p in enumerate(paragraphs)
+    ]
+
+    start = time.perf_counter()
+    store = NumpyVectorStore.load_or_create(
+        "./.cache/little_prince_store", embeddings, documents
+    )
+    print(f"startup: {time.perf_counter() - start:.3f}s, {len(store)} vectors")
+
+    query = embeddings.embed_query("What does the fox say?")
+    start = time.perf_counter()
+    for _ in range(100):
+        results = store.similarity_search_with_score_by_vector(query, k=4)
+    print(f"search: {(time.perf_counter() - start) * 10:.3f}ms per query")
+    for doc, score in results:
+        print(f"{score:.3f} {doc.page_content[:80]!r}")
@@ -6,12 +6,14 @@ from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
 from langchain_core.tools import tool
-from langchain_core.vectorstores.in_memory import InMemoryVectorStore
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langgraph.graph import START, StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode, tools_condition
 
+from ch2_embedding_cache import CachedEmbeddings
+from ch5_numpy_vectorstore import NumpyVectorStore
+
 
 @tool
 def calculator(query: str) -> str:
@@ -22,8 +24,9 @@ def calculator(query: str) -> str:
 search = DuckDuckGoSearchRun()
 tools = [search, calculator]
 
-embeddings = OllamaEmbeddings(
-    model="nomic-embed-text", base_url="http://localhost:11434"
+# 工具描述每次启动都一样，缓存后不会重复调用嵌入模型
+embeddings = CachedEmbeddings(
+    OllamaEmbeddings(model="nomic-embed-text", base_url="http://localhost:11434")
 )
 
 model = ChatOllama(
@@ -32,12 +35,14 @@ model = ChatOllama(
 
 # from_documnets直接创建向量存储
 # 这里把所有tool的描述存储为文档，并且把tool的名称作为metadata
-tools_retriever = InMemoryVectorStore.from_documents(
-    documents=[
+# 工具描述没有变化时直接加载快照
+tools_retriever = NumpyVectorStore.load_or_create(
+    "./.cache/tools_store",
+    embeddings,
+    [
         Document(page_content=tool.description, metadata={"name": tool.name})
         for tool in tools
     ],
-    embedding=embeddings,
 ).as_retriever()
 
 